@@ -1,4 +1,4 @@
-"""This module contains all constants that are used in the program"""
+"""This module contains all constants that are used in the program, and helpers for per-rank counts and move IDs"""
 
 ORIGINAL_RULE = 0
 SPECIAL_RULE1 = 1  # Have 2+1 type
@@ -7,6 +7,11 @@ SPECIAL_RULE3 = 3  # Landlord can play twice the first round
 rules_int2str = {ORIGINAL_RULE: 'ORIGINAL_RULE', SPECIAL_RULE1: 'SPECIAL_RULE1',
                  SPECIAL_RULE2: 'SPECIAL_RULE2', SPECIAL_RULE3: 'SPECIAL_RULE3'}
 
+# How the landlord is picked in set_up_new_game
+BID_HAND_POINTS = 0  # weighted by the squared sum of cards
+BID_HAND_FEATURES = 1  # weighted by the squared hand feature score (bombs, chains, ...)
+bidding_int2str = {BID_HAND_POINTS: 'HAND_POINTS', BID_HAND_FEATURES: 'HAND_FEATURES'}
+
 LANDLORD = 0
 PEASANT = 1
 PEASANT_1 = 1
@@ -21,6 +26,15 @@ int2rank = {3: '3', 4: '4', 5: '5', 6: '6', 7: '7', 8: '8', 9: '9', 10: 'T',
             11: 'J', 12: 'Q', 13: 'K', 14: 'A', 16: '2', 20: 'X', 30: 'D'}
 DECK_DICT = {'3': 4, '4': 4, '5': 4, '6': 4, '7': 4, '8': 4, '9': 4,
              'T': 4, 'J': 4, 'Q': 4, 'K': 4, 'A': 4, '2': 4, 'X': 1, 'D': 1}
+# index of each rank in a per-rank count vector, 3 to A are 0 to 11, 2 is 12, X is 13, D is 14
+RANK_ORDER = sorted(int2rank)
+rank2idx = {rank: idx for idx, rank in enumerate(RANK_ORDER)}
+RANKS = len(RANK_ORDER)
+FULL_COUNTS = [DECK_DICT[int2rank[rank]] for rank in RANK_ORDER]
+# 3 to A can form chains, 2 and kings cannot
+CHAIN_RANKS = rank2idx[14] + 1
+# a move ID packs the count of each rank in 3 bits, rank index i at bits 3i to 3i+2
+CARD_WEIGHT = {rank: 8 ** idx for idx, rank in enumerate(RANK_ORDER)}
 deckTypeWeightDict = {'Solo': 1, 'Pair': 2, 'Trio': 4, 'ChainSolo': 6, 'ChainPair': 6,
                       'Plane': 8, 'Quad': 8, 'Bomb': 10, 'Rocket': 16, 'Pass': 0}
 char_int_to_str = {
@@ -52,3 +66,44 @@ TYPE_17_2_2_1 = 17
 MIN_SERIAL_SINGLE = 5
 MIN_SERIAL_PAIR = 3
 MIN_SERIAL_TRIPLE = 2
+
+# At most this many kicker combinations are enumerated for one body (triple, plane or four).
+# Only a safety guard: a hand of 20 cards or fewer has at most C(11, 3) = 165 (a plane of 3 triples with 3 kickers
+# from the 11 other cards), so no legal move is dropped
+MAX_KICKER_COMBINATIONS = 4096
+
+
+def to_counts(cards: list) -> list:
+    """
+    the per-rank count vector of cards, ordered by RANK_ORDER
+    >>> to_counts([3, 3, 16, 30])
+    [2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1]
+    """
+    counts = [0] * RANKS
+    for card in cards:
+        counts[rank2idx[card]] += 1
+    return counts
+
+
+def to_cards(counts: list) -> list:
+    """
+    >>> to_cards([2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1])
+    [3, 3, 16, 30]
+    """
+    return [rank for rank, count in zip(RANK_ORDER, counts) for _ in range(count)]
+
+
+def move_id(move: list) -> int:
+    """
+    >>> move_id([]), move_id([3]), move_id([3, 3, 4]), move_id([20, 30])
+    (0, 1, 10, 4947802324992)
+    """
+    return sum(map(CARD_WEIGHT.__getitem__, move))
+
+
+def move_from_id(move_id_: int) -> list:
+    """
+    >>> move_from_id(move_id([3, 3, 4, 16, 16, 30]))
+    [3, 3, 4, 16, 16, 30]
+    """
+    return [rank for idx, rank in enumerate(RANK_ORDER) for _ in range(move_id_ >> 3 * idx & 7)]
@@ -0,0 +1,311 @@
+"""
+This module exports self-play decisions as training data, streamed into fixed-size memory-mapped .npy shards.
+Every decision is a row of:
+    states: int8 STATE_SIZE encoding, see encode_state
+    chosen: int64 move ID of the chosen move, see move_id (0 is pass)
+    legal: the int64 move IDs of the legal moves, rows legal_offsets[i] to legal_offsets[i + 1] of the legal file
+    outcome: int8, 1 when the side of the player won the game, -1 when it lost
+    game: int64, the game number of the exporter
+Decisions wait in memory as references until their game ends (the outcome is known then),
+are flattened into array.array columns and are encoded and written in blocks of buffer_size with NumPy,
+so the memory used is bounded by the games in play and the buffer, not by the number of decisions.
+"""
+
+from constants import *
+from array import array
+from itertools import chain
+import json
+import os
+
+# rank index of every card value, for NumPy lookups
+CARD_INDEX = [rank2idx.get(card, 0) for card in range(max(RANK_ORDER) + 1)]
+# name: size, in the order of the state encoding
+STATE_FIELDS = {
+    'hand': RANKS,  # counts of each rank in the player's hand
+    'rival_move': RANKS,  # counts of each rank of the move to beat, zeros when leading
+    'played': RANKS,  # counts of each rank played in the game so far
+    'cards_left': 3,  # cards left of the player, the next player and the previous player
+    'character': 1,  # LANDLORD, PEASANT_1 or PEASANT_2
+    'rule': 1
+}
+STATE_SIZE = sum(STATE_FIELDS.values())
+SHARD_FILES = ('states', 'chosen', 'legal_offsets', 'legal', 'outcome', 'game')
+# name: typecode of the buffered columns, the cards of the moves and the sizes of the moves are kept apart
+COLUMNS = {
+    # one row per decision
+    'character': 'b',
+    'rival': 'B', 'rival_sizes': 'B',
+    'legal': 'B', 'legal_sizes': 'B', 'legal_counts': 'H',  # cards, sizes of the legal moves, moves per decision
+    'chosen': 'B', 'chosen_sizes': 'B',
+    # one row per game, the starting hands are 3 rows per game in the order of the characters
+    'start': 'B', 'start_sizes': 'B',
+    'decisions': 'I', 'rule': 'b', 'winner': 'b', 'game': 'q'
+}
+
+
+def new_columns() -> dict:
+    return {name: array(typecode) for name, typecode in COLUMNS.items()}
+
+
+def encode_state(players: list, player, decision) -> list:
+    """
+    the state a player decides in, only with what the player can see
+    :param players: the 3 players of the game
+    :param player: the player to move, before the move is removed from the hand
+    :param decision: the Decision of the player
+    :return: a list of STATE_SIZE ints
+    >>> from game_functions import Player, make_decision
+    >>> players = [Player() for _ in range(3)]
+    >>> players[0].hand.cards, players[1].hand.cards, players[2].hand.cards = [3, 4], [5], [6, 6]
+    >>> state = encode_state(players, players[0], make_decision(players[0], [[5]]))
+    >>> len(state), state[45:48]
+    (50, [2, 1, 2])
+    """
+    index = players.index(player)
+    hands = [players[(index + k) % 3].hand.cards for k in range(3)]
+    played = FULL_COUNTS[:]
+    for hand in hands:
+        for card in hand:
+            played[rank2idx[card]] -= 1
+    return (to_counts(decision.hand) + to_counts(decision.rival_move) + played
+            + [len(hand) for hand in hands] + [player.character, decision.rule])
+
+
+class ShardWriter:
+    """Streams decisions of games into memory-mapped .npy shards of fixed size"""
+
+    def __init__(self, directory: str, shard_decisions=1 << 18, shard_legal=1 << 22, buffer_size=1 << 14):
+        """
+        :param directory: where the shards and manifest.json are written
+        :param shard_decisions: decisions per shard
+        :param shard_legal: legal move IDs per shard, a shard is closed when either part is full
+        :param buffer_size: finished decisions kept in memory before they are written
+        """
+        self.directory = directory
+        self.shard_decisions = shard_decisions
+        self.shard_legal = shard_legal
+        self.buffer_size = buffer_size
+        self.games = 0
+        self.pending = {}  # game number: (starting hands by character, rule, [(character, rival, legal, chosen)])
+        self.buffer = new_columns()  # columns of finished games
+        self.buffered = 0  # decisions in the buffer
+        self.shards = []  # {'decisions': n, 'legal': n} of every shard
+        self.shard = None  # the memmaps of the open shard
+        self.used = (0, 0)  # decisions, legal IDs in the open shard
+        os.makedirs(directory, exist_ok=True)
+
+    def start_game(self, players: list, rule=0) -> int:
+        """
+        copies the starting hands once, the hands of later decisions are rebuilt from them in encode_columns
+        :return: the game number, used in add and end_game
+        """
+        self.games += 1
+        hands = [b''] * 3
+        for player in players:
+            hands[player.character] = bytes(player.hand.cards)
+        self.pending[self.games] = (hands, rule, [])
+        return self.games
+
+    def add(self, game: int, player, decision, move: list) -> None:
+        """
+        records a decision and its chosen move before the move is played, the encoding is done in flush.
+        Only references are kept: the character tells the seat, and the moves are not changed later.
+        They are flattened once per game in end_game
+        """
+        self.pending[game][2].append((decision.character, decision.rival_move, decision.moves, move))
+
+    def end_game(self, game: int, winner: int) -> None:
+        """flattens the decisions of a game into the buffer, they are written once their outcome is known"""
+        hands, rule, moves = self.pending.pop(game)
+        characters, rival_moves, legal_moves, chosen = zip(*moves) if moves else ((), (), (), ())
+        buffer = self.buffer
+        buffer['character'].frombytes(bytes(characters))
+        buffer['rival'].frombytes(bytes(chain.from_iterable(rival_moves)))
+        buffer['rival_sizes'].frombytes(bytes(map(len, rival_moves)))
+        legal = list(chain.from_iterable(legal_moves))
+        buffer['legal'].frombytes(bytes(chain.from_iterable(legal)))
+        buffer['legal_sizes'].frombytes(bytes(map(len, legal)))
+        buffer['legal_counts'].extend(map(len, legal_moves))
+        buffer['chosen'].frombytes(bytes(chain.from_iterable(chosen)))
+        buffer['chosen_sizes'].frombytes(bytes(map(len, chosen)))
+        buffer['start'].frombytes(b''.join(hands))
+        buffer['start_sizes'].frombytes(bytes(map(len, hands)))
+        buffer['decisions'].append(len(moves))
+        buffer['rule'].append(rule)
+        buffer['winner'].append(winner)
+        buffer['game'].append(game)
+        self.buffered += len(moves)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def open_shard(self) -> None:
+        from numpy.lib.format import open_memmap
+        n = len(self.shards)
+        self.shards.append({'decisions': 0, 'legal': 0})
+        shapes = {'states': ((self.shard_decisions, STATE_SIZE), 'int8'),
+                  'chosen': ((self.shard_decisions,), 'int64'),
+                  'legal_offsets': ((self.shard_decisions + 1,), 'int64'),
+                  'legal': ((self.shard_legal,), 'int64'),
+                  'outcome': ((self.shard_decisions,), 'int8'),
+                  'game': ((self.shard_decisions,), 'int64')}
+        self.shard = {name: open_memmap(self.path(n, name), mode='w+', dtype=dtype, shape=shape)
+                      for name, (shape, dtype) in shapes.items()}
+        self.used = (0, 0)
+
+    def close_shard(self) -> None:
+        if self.shard is None:
+            return
+        for array in self.shard.values():
+            array.flush()
+        self.shards[-1] = {'decisions': self.used[0], 'legal': self.used[1]}
+        self.shard = None
+
+    def path(self, shard: int, name: str) -> str:
+        return os.path.join(self.directory, f'shard_{shard:05d}_{name}.npy')
+
+    def flush(self) -> None:
+        """encodes the buffered rows at once and writes them into the shards as blocks"""
+        import numpy as np
+        columns, decisions = self.buffer, self.buffered
+        self.buffer, self.buffered = new_columns(), 0
+        if not decisions:
+            return
+        arrays = encode_columns(columns)
+        legal_ends = np.cumsum(arrays['legal_counts'])
+        start = 0
+        while start < decisions:
+            if self.shard is None:
+                self.open_shard()
+            used_decisions, used_legal = self.used
+            legal_start = legal_ends[start - 1] if start else 0
+            # as many rows as fit in both parts of the open shard
+            end = min(decisions, start + self.shard_decisions - used_decisions)
+            end = min(end, int(np.searchsorted(legal_ends, legal_start + self.shard_legal - used_legal, side='right')))
+            if end == start:
+                if not used_decisions:
+                    raise ValueError(f'a decision has more than {self.shard_legal} legal moves')
+                self.close_shard()
+                continue
+            stop = used_decisions + end - start
+            legal_stop = used_legal + int(legal_ends[end - 1] - legal_start)
+            for name in ('states', 'chosen', 'outcome', 'game'):
+                self.shard[name][used_decisions:stop] = arrays[name][start:end]
+            self.shard['legal_offsets'][used_decisions + 1:stop + 1] = used_legal + legal_ends[start:end] - legal_start
+            self.shard['legal'][used_legal:legal_stop] = arrays['legal'][legal_start:legal_ends[end - 1]]
+            self.used = (stop, legal_stop)
+            self.shards[-1] = {'decisions': stop, 'legal': legal_stop}
+            if stop == self.shard_decisions:
+                self.close_shard()
+            start = end
+
+    def close(self) -> None:
+        """
+        writes what is left and the manifest, games still in play are dropped
+        >>> import tempfile
+        >>> from game_functions import Player, set_up_new_game, play_games
+        >>> games = [[Player() for _ in range(3)] for _ in range(3)]
+        >>> for players in games:
+        ...     set_up_new_game(players, landlord_lv=3, peasants_lv=3)
+        >>> with tempfile.TemporaryDirectory() as directory:
+        ...     writer = ShardWriter(directory, shard_decisions=64, buffer_size=50)
+        ...     _ = play_games(games, exporter=writer)
+        ...     writer.close()
+        ...     shards = [load_shard(directory, n) for n in range(len(writer.shards))]
+        ...     rows = [(s['chosen'][i], s['legal'][s['legal_offsets'][i]:s['legal_offsets'][i + 1]])
+        ...             for s in shards for i in range(len(s['chosen']))]
+        >>> len(shards) > 1, all(chosen in legal or (chosen == 0 and not len(legal)) for chosen, legal in rows)
+        (True, True)
+        """
+        self.flush()
+        self.close_shard()
+        with open(os.path.join(self.directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'state_fields': STATE_FIELDS, 'shards': self.shards, 'files': SHARD_FILES}, f)
+
+
+def _owners_and_ranks(cards: array, sizes: array) -> tuple:
+    """
+    :param cards: the cards of all the moves, one after another
+    :param sizes: the number of cards of each move
+    :return: arrays of the move index and the rank index of every card
+    """
+    import numpy as np
+    owners = np.repeat(np.arange(len(sizes)), np.frombuffer(sizes, dtype=np.uint8))
+    return owners, np.array(CARD_INDEX)[np.frombuffer(cards, dtype=np.uint8)]
+
+
+def _rank_counts(cards: array, sizes: array):
+    """(len(sizes), RANKS) array of the rank counts of every move"""
+    import numpy as np
+    owners, ranks = _owners_and_ranks(cards, sizes)
+    return np.bincount(owners * RANKS + ranks, minlength=len(sizes) * RANKS).reshape(len(sizes), RANKS)
+
+
+def _move_ids(cards: array, sizes: array):
+    """int64 array of the move_id of every move"""
+    import numpy as np
+    owners, ranks = _owners_and_ranks(cards, sizes)
+    # the sums stay below 8 ** 15 == 2 ** 45, exact in float64
+    return np.bincount(owners, weights=8.0 ** ranks, minlength=len(sizes)).astype(np.int64)
+
+
+def encode_columns(columns: dict) -> dict:
+    """
+    vectorized encode_state and move_id of buffered decisions, the decisions of a game must be together and in order.
+    The hands, the cards left and the cards played are rebuilt from the starting hands and the chosen moves
+    :param columns: the COLUMNS of the games, see ShardWriter.end_game
+    :return: a dict of arrays: states, chosen, outcome, game, legal (all the legal move IDs) and legal_counts
+    >>> columns = new_columns()
+    >>> for name, values in [('character', [0, 1]), ('rival', [4]), ('rival_sizes', [0, 1]),
+    ...                      ('legal', [3, 4, 5]), ('legal_sizes', [1, 1, 1]), ('legal_counts', [2, 1]),
+    ...                      ('chosen', [4, 5]), ('chosen_sizes', [1, 1]), ('start', [3, 4, 5, 6, 6]),
+    ...                      ('start_sizes', [2, 1, 2]), ('decisions', [2]), ('rule', [0]), ('winner', [1]),
+    ...                      ('game', [1])]:
+    ...     columns[name].extend(values)
+    >>> arrays = encode_columns(columns)
+    >>> arrays['states'][1, 30:45].tolist() == to_counts([4]), arrays['states'][1, 45:48].tolist()
+    (True, [1, 2, 1])
+    >>> arrays['chosen'].tolist(), arrays['legal'].tolist(), arrays['outcome'].tolist()
+    ([8, 64], [1, 8, 64], [-1, 1])
+    """
+    import numpy as np
+    decisions = np.frombuffer(columns['decisions'], dtype=np.uint32)
+    games = np.repeat(np.arange(len(decisions)), decisions)  # row of the game of every decision
+    rows = np.arange(len(games))
+    character = np.frombuffer(columns['character'], dtype=np.int8).astype(np.int64)
+    # cards each character played before each decision: the chosen moves of the earlier decisions of its game
+    by_character = np.zeros((len(games), 3, RANKS), dtype=np.int64)
+    by_character[rows, character] = _rank_counts(columns['chosen'], columns['chosen_sizes'])
+    before = np.cumsum(by_character, axis=0) - by_character
+    first = np.cumsum(decisions) - decisions
+    before -= before[first[games]]
+    left = _rank_counts(columns['start'], columns['start_sizes']).reshape(-1, 3, RANKS)[games] - before
+    cards_left = left.sum(axis=2)
+    winner = np.frombuffer(columns['winner'], dtype=np.int8)[games]
+    states = np.concatenate([left[rows, character],
+                             _rank_counts(columns['rival'], columns['rival_sizes']),
+                             before.sum(axis=1),
+                             cards_left[rows[:, None], (character[:, None] + np.arange(3)) % 3],
+                             character[:, None],
+                             np.frombuffer(columns['rule'], dtype=np.int8)[games, None]], axis=1)
+    return {'states': states.astype(np.int8),
+            'chosen': _move_ids(columns['chosen'], columns['chosen_sizes']),
+            'outcome': np.where((character == LANDLORD) == (winner == LANDLORD), 1, -1).astype(np.int8),
+            'game': np.frombuffer(columns['game'], dtype=np.int64)[games],
+            'legal': _move_ids(columns['legal'], columns['legal_sizes']),
+            'legal_counts': np.frombuffer(columns['legal_counts'], dtype=np.uint16).astype(np.int64)}
+
+
+def load_shard(directory: str, shard: int) -> dict:
+    """
+    the arrays of a closed shard, memory-mapped read-only and cut to the rows written
+    :return: a dict of SHARD_FILES names to arrays
+    """
+    import numpy as np
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+        counts = json.load(f)['shards'][shard]
+    arrays = {}
+    for name in SHARD_FILES:
+        array = np.load(os.path.join(directory, f'shard_{shard:05d}_{name}.npy'), mmap_mode='r')
+        size = counts['legal'] if name == 'legal' else counts['decisions'] + (name == 'legal_offsets')
+        arrays[name] = array[:size]
+    return arrays
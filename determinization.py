@@ -0,0 +1,157 @@
+"""
+This module samples hidden hands for search-based players: deals of the unseen cards to the two opponents
+that are consistent with the known hand sizes and per-rank bounds (e.g. from passes or the landlord's 3 cards).
+Deals are drawn exactly and uniformly by counting, without rejection.
+"""
+
+from constants import *
+from math import comb
+import random
+
+
+def unseen_counts(own_hand: list, played_cards: list) -> list:
+    """
+    the cards a player has not seen, held by the two opponents
+    >>> sum(unseen_counts([3, 4, 5], [16, 16]))
+    49
+    """
+    own, played = to_counts(own_hand), to_counts(played_cards)
+    return [full - o - p for full, o, p in zip(FULL_COUNTS, own, played)]
+
+
+def pass_upper_bounds(rival_move: list) -> list:
+    """
+    upper bounds of a hand that passed on a rival move. Players only pass without a legal move,
+    so they have no bomb that beats it and nothing of the same type that beats it (singles, pairs and triples).
+    As in gen_type_4_bomb and can_beat, only bombs of a rank above rival_move[0] beat a move, so lower ones are allowed.
+    The rocket cannot be written as a per-rank bound and is not used.
+    >>> pass_upper_bounds([14])
+    [4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 0, 0, 0]
+    >>> pass_upper_bounds([9, 9])[5:]
+    [4, 4, 1, 1, 1, 1, 1, 1, 1, 1]
+    >>> pass_upper_bounds([9, 9, 9, 9])[5:8]
+    [4, 4, 3]
+    """
+    if not rival_move or rival_move == [20, 30]:
+        return [4] * RANKS
+    bounds = [min(full, 3) if rank > rival_move[0] else full for rank, full in zip(RANK_ORDER, FULL_COUNTS)]
+    if 1 <= len(rival_move) <= 3 and len(set(rival_move)) == 1:
+        above = len(rival_move) - 1
+        bounds = [min(bound, above) if rank > rival_move[0] else bound for rank, bound in zip(RANK_ORDER, bounds)]
+    return bounds
+
+
+def lower_bounds_from_cards(cards: list) -> list:
+    """
+    lower bounds of a hand known to hold cards, e.g. the landlord's 3 cards not played yet
+    >>> lower_bounds_from_cards([3, 20])[0], lower_bounds_from_cards([3, 20])[13]
+    (1, 1)
+    """
+    return to_counts(cards)
+
+
+class DeterminizationSampler:
+    """
+    Samples how the unseen cards are split between opponent A and opponent B.
+    Per rank, A gets a cards and B gets the rest; the number of ways a completion can give A exactly k more cards
+    is counted once (ways table), then every sample walks the ranks choosing a with probability
+    comb(unseen, a) * ways[next rank][k - a] / ways[rank][k], which is uniform over all consistent deals.
+    """
+
+    def __init__(self, unseen: list, size_a: int, size_b: int, lower_a=None, upper_a=None, lower_b=None, upper_b=None):
+        """
+        :param unseen: 15 counts of the unseen cards
+        :param size_a: number of cards of opponent A
+        :param size_b: number of cards of opponent B
+        :param lower_a: 15 lower bounds of A's counts, e.g. lower_bounds_from_cards
+        :param upper_a: 15 upper bounds of A's counts, e.g. pass_upper_bounds
+        :param lower_b: like lower_a for B
+        :param upper_b: like upper_a for B
+        """
+        if sum(unseen) != size_a + size_b:
+            raise ValueError(f'{sum(unseen)} unseen cards cannot make hands of {size_a} and {size_b}')
+        self.unseen = unseen
+        self.size_a = size_a
+        lower_a = lower_a or [0] * RANKS
+        upper_a = upper_a or [4] * RANKS
+        lower_b = lower_b or [0] * RANKS
+        upper_b = upper_b or [4] * RANKS
+        # B holds unseen - a, so its bounds are bounds on a too
+        self.low = [max(lower_a[r], unseen[r] - upper_b[r], 0) for r in range(RANKS)]
+        self.high = [min(upper_a[r], unseen[r] - lower_b[r], unseen[r]) for r in range(RANKS)]
+
+        # ways[r][k]: weighted ways ranks r.. give A exactly k cards
+        self.ways = [[0] * (size_a + 1) for _ in range(RANKS + 1)]
+        self.ways[RANKS][0] = 1
+        for r in reversed(range(RANKS)):
+            for k in range(size_a + 1):
+                self.ways[r][k] = sum(comb(unseen[r], a) * self.ways[r + 1][k - a]
+                                      for a in range(self.low[r], min(self.high[r], k) + 1))
+        if not self.ways[0][size_a]:
+            raise ValueError('no deal is consistent with the bounds')
+
+    def consistent_deals(self) -> int:
+        """
+        number of consistent deals (distinct card sets for A)
+        >>> DeterminizationSampler(to_counts([3, 3, 4, 5]), 2, 2).consistent_deals() == comb(4, 2)
+        True
+        """
+        return self.ways[0][self.size_a]
+
+    def sample(self, rng=random) -> tuple:
+        """
+        one consistent deal
+        :param rng: a random.Random object or the random module
+        :return: (A's 15 counts, B's 15 counts)
+        >>> s = DeterminizationSampler(to_counts([3, 3, 4, 20]), 2, 2, upper_a=pass_upper_bounds([4]))
+        >>> sorted({tuple(to_cards(a)) for a, b in s.sample_batch(100, seed=1)})
+        [(3, 3), (3, 4)]
+        """
+        counts_a = [0] * RANKS
+        k = self.size_a
+        for r in range(RANKS):
+            target = rng.randrange(self.ways[r][k])
+            for a in range(self.low[r], min(self.high[r], k) + 1):
+                target -= comb(self.unseen[r], a) * self.ways[r + 1][k - a]
+                if target < 0:
+                    break
+            counts_a[r] = a
+            k -= a
+        return counts_a, [u - a for u, a in zip(self.unseen, counts_a)]
+
+    def sample_batch(self, n: int, seed=None) -> list:
+        """
+        :return: a list of n (A's counts, B's counts)
+        """
+        rng = random.Random(seed)
+        return [self.sample(rng) for _ in range(n)]
+
+    def sample_array(self, n: int, seed=None):
+        """
+        n consistent deals at once with NumPy, as an int8 array of shape (n, 2, 15) of A's and B's counts
+        >>> s = DeterminizationSampler(unseen_counts([3, 4, 5], []), 26, 25, upper_a=pass_upper_bounds([16]))
+        >>> deals = s.sample_array(1000, seed=1)
+        >>> deals.shape, set(deals[:, 0].sum(axis=1).tolist()), int(deals[:, 0, 13:].max())
+        ((1000, 2, 15), {26}, 0)
+        """
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        counts_a = np.zeros((n, RANKS), dtype=np.int8)
+        k = np.full(n, self.size_a)
+        for r in range(RANKS):
+            # cumulative probability of giving A at most low + i cards, for every remaining k
+            options = range(self.low[r], self.high[r] + 1)
+            cdf = np.zeros((self.size_a + 1, len(options)))
+            for kk in range(self.size_a + 1):
+                if not self.ways[r][kk]:
+                    continue
+                weights = [comb(self.unseen[r], a) * self.ways[r + 1][kk - a] if a <= kk else 0 for a in options]
+                cdf[kk] = np.cumsum([w / self.ways[r][kk] for w in weights])
+                # no sample may fall past the last possible option because of rounding
+                cdf[kk, max(i for i, w in enumerate(weights) if w):] = 2.0
+            u = rng.random(n)
+            a = (u[:, None] >= cdf[k]).sum(axis=1) + self.low[r]
+            counts_a[:, r] = a
+            k = k - a
+        unseen = np.array(self.unseen, dtype=np.int8)
+        return np.stack([counts_a, unseen - counts_a], axis=1)
@@ -0,0 +1,664 @@
+"""
+This module solves deals double-dummy: every hand is known to every player and all play perfectly,
+so the result says whether the deal itself is a landlord win, apart from how the levels play it.
+The search is an AND/OR alpha-beta over the MoveGeneration moves (the landlord needs one winning move, the peasants
+one refutation) with move ordering, a transposition table, a node budget and a timeout per deal.
+To keep the branching down it works on per-rank counts, searches moves that only differ by interchangeable ranks
+(mostly kicker choices) once, and stops at a hand that plays out in moves nobody beats.
+The moves of the root are searched in rounds or split across worker processes.
+
+Deals are stored as JSON lines: {"hands": [3 sorted card lists], "landlord": seat, "rule": rule, "winner": ...},
+where winner is the result of the heuristic play of the deal (see record_deals).
+"""
+
+from game_functions import *
+from game_moves import can_beat, rank_masks, rival_profile
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations
+import json
+import time
+
+LANDLORD_WINS = 1
+PEASANTS_WIN = 0
+UNKNOWN = None  # the node budget or the timeout ran out
+
+# hands and moves are searched as move IDs (see constants.move_id): the count of rank index i at bits 3i to 3i+2,
+# so removing a move is a subtraction and equal hands are equal ints
+UNIT = [CARD_WEIGHT[rank] for rank in RANK_ORDER]
+SMALL_KING, BIG_KING = rank2idx[20], rank2idx[30]
+
+
+class SearchLimit(Exception):
+    """raised inside the search when the node budget or the timeout of a deal runs out"""
+
+
+def id_counts(hand: int) -> list:
+    """
+    the per-rank counts of a move ID, like to_counts of its cards
+    >>> id_counts(move_id([3, 3, 4, 30]))
+    [2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+    """
+    return [hand >> 3 * idx & 7 for idx in range(RANKS)]
+
+
+def with_kickers(body: int, counts: list, exclude, kickers: int, width: int) -> list:
+    """the body with every choice of kickers distinct ranks outside exclude, width cards of each"""
+    pool = [idx for idx, count in enumerate(counts) if count >= width and idx not in exclude]
+    return [body + width * sum(UNIT[idx] for idx in choice) for choice in combinations(pool, kickers)]
+
+
+def chains(counts: list, repeat: int, min_len: int, above=-1, length=0) -> list:
+    """(start index, length) of the chains of repeat cards per rank, of any length from min_len or exactly length"""
+    result = []
+    for start in range(above + 1, CHAIN_RANKS):
+        end = start
+        while end < CHAIN_RANKS and counts[end] >= repeat:
+            end += 1
+        if length:
+            if end - start >= length:
+                result.append((start, length))
+        else:
+            result.extend((start, n) for n in range(min_len, end - start + 1))
+    return result
+
+
+def chain_body(start: int, n: int, repeat: int) -> int:
+    return repeat * sum(UNIT[start:start + n])
+
+
+def type_moves(counts: list, move_type: int, above=-1, length=0) -> list:
+    """the moves of a type with a rank index above above, the chains of exactly length when it is given"""
+    moves = []
+    if move_type in (TYPE_1_SINGLE, TYPE_2_PAIR, TYPE_3_TRIPLE):
+        moves = [move_type * UNIT[idx] for idx in range(above + 1, RANKS) if counts[idx] >= move_type]
+    elif move_type == TYPE_4_BOMB:
+        moves = [4 * UNIT[idx] for idx in range(above + 1, RANKS) if counts[idx] == 4]
+    elif move_type == TYPE_5_KING_BOMB:
+        if counts[SMALL_KING] and counts[BIG_KING]:
+            moves = [UNIT[SMALL_KING] + UNIT[BIG_KING]]
+    elif move_type in (TYPE_6_3_1, TYPE_7_3_2):
+        for idx in range(above + 1, RANKS):
+            if counts[idx] >= 3:
+                moves += with_kickers(3 * UNIT[idx], counts, (idx,), 1, move_type - TYPE_6_3_1 + 1)
+    elif move_type in (TYPE_8_SERIAL_SINGLE, TYPE_9_SERIAL_PAIR, TYPE_10_SERIAL_TRIPLE):
+        repeat = move_type - TYPE_8_SERIAL_SINGLE + 1
+        min_len = (MIN_SERIAL_SINGLE, MIN_SERIAL_PAIR, MIN_SERIAL_TRIPLE)[repeat - 1]
+        moves = [chain_body(start, n, repeat) for start, n in chains(counts, repeat, min_len, above, length)]
+    elif move_type in (TYPE_11_SERIAL_3_1, TYPE_12_SERIAL_3_2):
+        for start, n in chains(counts, 3, MIN_SERIAL_TRIPLE, above, length):
+            moves += with_kickers(chain_body(start, n, 3), counts, range(start, start + n), n,
+                                  move_type - TYPE_11_SERIAL_3_1 + 1)
+    elif move_type in (TYPE_13_4_2, TYPE_14_4_22):
+        for idx in range(above + 1, RANKS):
+            if counts[idx] == 4:
+                moves += with_kickers(4 * UNIT[idx], counts, (idx,), 2, move_type - TYPE_13_4_2 + 1)
+    elif move_type == TYPE_16_2_1:
+        for idx in range(above + 1, RANKS):
+            if counts[idx] >= 2:
+                moves += with_kickers(2 * UNIT[idx], counts, (idx,), 1, 1)
+    elif move_type == TYPE_17_2_2_1:
+        pairs = [idx for idx in range(RANKS) if counts[idx] >= 2]
+        for low, high in combinations(pairs, 2):
+            if high > above:
+                moves += with_kickers(2 * UNIT[low] + 2 * UNIT[high], counts, (low, high), 1, 1)
+    return moves
+
+
+LEAD_TYPES = (TYPE_1_SINGLE, TYPE_2_PAIR, TYPE_3_TRIPLE, TYPE_4_BOMB, TYPE_5_KING_BOMB, TYPE_6_3_1, TYPE_7_3_2,
+              TYPE_8_SERIAL_SINGLE, TYPE_9_SERIAL_PAIR, TYPE_10_SERIAL_TRIPLE, TYPE_11_SERIAL_3_1,
+              TYPE_12_SERIAL_3_2, TYPE_13_4_2, TYPE_14_4_22)
+RULE_TYPES = {SPECIAL_RULE1: (TYPE_16_2_1,), SPECIAL_RULE2: (TYPE_17_2_2_1,)}
+
+
+@lru_cache(maxsize=1 << 15)
+def legal_move_ids(hand: int, rival_move: int, rule: int) -> tuple:
+    """
+    the distinct legal moves of a hand as move IDs, the same set as MoveGeneration makes from card lists.
+    The second example checks that for hands of 1 to 20 cards against every lead move of another hand,
+    under rules 0 to 2, so that every rival type is covered
+    >>> [move_from_id(move) for move in legal_move_ids(move_id([5, 5, 5, 5, 30]), move_id([4, 4, 4, 4]), 0)]
+    [[5, 5, 5, 5]]
+    >>> import random
+    >>> from game_moves import get_move_type
+    >>> rng = random.Random(7)
+    >>> deck = [rank for rank, count in zip(RANK_ORDER, FULL_COUNTS) for _ in range(count)]
+    >>> agree, rival_types = True, set()
+    >>> for rule in (ORIGINAL_RULE, SPECIAL_RULE1, SPECIAL_RULE2):
+    ...     for _ in range(4):
+    ...         cards = rng.sample(deck, 40)
+    ...         hand, other = sorted(cards[:rng.randint(1, 20)]), sorted(cards[20:])
+    ...         for rival_move in (0,) + legal_move_ids(move_id(other), 0, rule):
+    ...             move_generator = MoveGeneration(hand, move_from_id(rival_move), rule)
+    ...             move_generator.generate_move()
+    ...             moves = {move_id(move) for move in move_generator.new_move}
+    ...             agree &= moves == set(legal_move_ids(move_id(hand), rival_move, rule))
+    ...             rival_types.add(get_move_type(move_from_id(rival_move))['type'])
+    >>> agree, sorted(rival_types)
+    (True, [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 16, 17])
+    """
+    counts = id_counts(hand)
+    if not rival_move:
+        moves = []
+        for move_type in LEAD_TYPES + RULE_TYPES.get(rule, ()):
+            moves += type_moves(counts, move_type)
+        return tuple(dict.fromkeys(moves))
+    rival_cards = tuple(move_from_id(rival_move))
+    move_type, rank, length = rival_profile(rival_cards)
+    moves = type_moves(counts, move_type, rank2idx[rank], length) if move_type not in (4, 5) else []
+    # as in gen_type_4_bomb, bombs beat any other move and bombs of a lower rank
+    moves += type_moves(counts, TYPE_4_BOMB, rank2idx[rival_cards[0]]) + type_moves(counts, TYPE_5_KING_BOMB)
+    return tuple(dict.fromkeys(moves))
+
+
+@lru_cache(maxsize=1 << 17)
+def min_moves(hand: int) -> int:
+    """
+    the fewest moves that play out a hand, to try the moves that leave the fewest first.
+    Every way to play it out has a move with the lowest card, so only those moves are tried
+    >>> min_moves(move_id([3, 4, 5, 6, 7, 9, 9, 9, 10])), min_moves(move_id([3, 5, 7]))
+    (2, 3)
+    """
+    if not hand:
+        return 0
+    low = (hand & -hand).bit_length() - 1
+    low_unit = UNIT[low // 3]
+    return 1 + min(min_moves(hand - move) for move in legal_move_ids(hand, 0, ORIGINAL_RULE) if move // low_unit % 8)
+
+
+@lru_cache(maxsize=1 << 16)
+def card_count(move: int) -> int:
+    return sum(id_counts(move))
+
+
+@lru_cache(maxsize=1 << 16)
+def beats(hand: int, move: int) -> bool:
+    """whether a hand has a legal move against a move"""
+    return can_beat(rank_masks(Counter(move_from_id(hand))), move_from_id(move))
+
+
+@lru_cache(maxsize=1 << 16)
+def presence(hand: int) -> int:
+    """a bit per rank index the hand holds"""
+    return sum(1 << idx for idx in range(RANKS) if hand >> 3 * idx & 7)
+
+
+@lru_cache(maxsize=1 << 16)
+def chain_ranks(hand: int) -> int:
+    """
+    a bit per rank index that is part of some chain of the hand
+    >>> bin(chain_ranks(move_id([3, 4, 5, 6, 7, 9, 9, 10, 10, 16])))
+    '0b11111'
+    """
+    counts = id_counts(hand)
+    ranks = 0
+    for repeat, min_len in ((1, MIN_SERIAL_SINGLE), (2, MIN_SERIAL_PAIR), (3, MIN_SERIAL_TRIPLE)):
+        for start, n in chains(counts, repeat, min_len):
+            ranks |= ((1 << n) - 1) << start
+    return ranks
+
+
+@lru_cache(maxsize=1 << 16)
+def has_rocket(hand: int) -> bool:
+    return bool(hand >> 3 * SMALL_KING & 1 and hand >> 3 * BIG_KING & 1)
+
+
+@lru_cache(maxsize=1 << 16)
+def rank_classes(hand: int, others: int) -> tuple:
+    """
+    the class of every rank index of a hand that can be swapped with another one without changing the game,
+    -1 for the others. Two ranks are swapped when the hand holds as many of each, neither is part of a chain or the
+    rocket, and the other players hold no rank between them: then every move beats and is beaten by the same moves
+    :param others: presence of the cards of the other two players
+    >>> rank_classes(move_id([3, 5, 8, 8, 9, 9, 16]), presence(move_id([10, 30])))[:13]
+    (0, -1, 0, -1, -1, 5, 5, -1, -1, -1, -1, -1, -1)
+    """
+    counts = id_counts(hand)
+    excluded = chain_ranks(hand) | (1 << SMALL_KING | 1 << BIG_KING if has_rocket(hand) else 0)
+    classes = [-1] * RANKS
+    open_classes = {}  # count: the class that ranks with that count join
+    members = Counter()
+    for idx in range(RANKS):
+        if others >> idx & 1:
+            open_classes = {}
+        if counts[idx] and not excluded >> idx & 1:
+            classes[idx] = open_classes.setdefault(counts[idx], idx)
+            members[classes[idx]] += 1
+    return tuple(cls if members[cls] > 1 else -1 for cls in classes)
+
+
+def collapse(moves: tuple, hand: int, others: int) -> list:
+    """
+    one move of every set of moves that only differ by swapped ranks (see rank_classes), mostly kicker choices
+    >>> hand = move_id([3, 5, 9, 9, 9])
+    >>> [move_from_id(move) for move in collapse(legal_move_ids(hand, 0, 0), hand, presence(move_id([6, 16])))]
+    [[3], [9], [9, 9], [9, 9, 9], [3, 9, 9, 9]]
+    """
+    classes = rank_classes(hand, others)
+    if max(classes) < 0:
+        return list(moves)
+    distinct = {}
+    for move in moves:
+        rest = move
+        swapped = []
+        for idx, cls in enumerate(classes):
+            if cls >= 0:
+                count = move >> 3 * idx & 7
+                rest -= count * UNIT[idx]
+                swapped.append((cls, count))
+        distinct.setdefault((rest, tuple(sorted(swapped))), move)
+    return list(distinct.values())
+
+
+@lru_cache(maxsize=1 << 17)
+def compress(hand: int, used: int) -> int:
+    """the counts of the used rank indices only, packed next to each other"""
+    packed = shift = 0
+    for idx in range(RANKS):
+        if used >> idx & 1:
+            packed |= (hand >> 3 * idx & 7) << shift
+            shift += 3
+    return packed
+
+
+class DoubleDummySolver:
+    """
+    Solves one position at a time, the transposition table is kept between positions of the same rule.
+    The memory of a solver is bounded by table_size: the transposition table keeps the entries of the last two
+    generations of table_size entries, and the play-out table is cleared at table_size entries.
+    With the default a process stays around 300 MB, caches included
+    """
+
+    def __init__(self, rule=ORIGINAL_RULE, max_nodes=2_000_000, timeout=60.0, voluntary_pass=False,
+                 table_size=1 << 19):
+        """
+        :param rule: the rule of the deals
+        :param max_nodes: node budget of a solve call, the nodes of the play-out checks count too
+        :param timeout: seconds of a solve call
+        :param voluntary_pass: players may pass while they have a legal move, as in the real game.
+                               False follows the simulation, where players only pass without one
+        :param table_size: entries of a generation of the transposition table, about 150 bytes each
+        """
+        self.rule = rule
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.voluntary_pass = voluntary_pass
+        self.table_size = table_size
+        self.table = {}  # key: landlord wins
+        self.old_table = {}  # the generation before, dropped when the table fills up again
+        self.play_outs = {}  # (hand, threats): the hand plays out
+        self.nodes = 0
+        self.deadline = 0.0
+        self.landlord = 0
+        # with worker processes: an Event that stops the search and a shared count of the nodes of the deal
+        self.stop = None
+        self.shared_nodes = None
+
+    def solve(self, hands: tuple, landlord: int, to_move: int, rival_move=(), last=None):
+        """
+        :param hands: 3 lists of cards, in seat order
+        :param landlord: the seat of the landlord
+        :param to_move: the seat to move
+        :param rival_move: the move to beat, () when leading
+        :param last: the seat that played rival_move
+        :return: LANDLORD_WINS, PEASANTS_WIN or UNKNOWN
+        >>> solver = DoubleDummySolver()
+        >>> solver.solve(([3, 3], [4], [5]), landlord=0, to_move=0)
+        1
+        >>> solver.solve(([3, 4], [5, 6], [16]), landlord=0, to_move=0)
+        0
+        """
+        if landlord != self.landlord:
+            self.table.clear()
+            self.old_table.clear()
+            self.play_outs.clear()
+        self.landlord = landlord
+        self.nodes = 0
+        self.deadline = time.monotonic() + self.timeout
+        try:
+            won = self.search(tuple(move_id(hand) for hand in hands), to_move, move_id(rival_move), last)
+        except SearchLimit:
+            return UNKNOWN
+        return LANDLORD_WINS if won else PEASANTS_WIN
+
+    def count_node(self) -> None:
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SearchLimit
+        if not self.nodes & 1023:
+            if time.monotonic() > self.deadline:
+                raise SearchLimit
+            if self.stop is not None:
+                with self.shared_nodes.get_lock():
+                    self.shared_nodes.value += 1024
+                    if self.shared_nodes.value >= self.max_nodes:
+                        self.stop.set()
+                if self.stop.is_set():
+                    raise SearchLimit
+
+    def threats(self, hands: tuple, seat: int) -> tuple:
+        """the hands that would beat a move of the seat: a peasant's teammate only has to when passes are forced"""
+        if seat == self.landlord or not self.voluntary_pass:
+            return tuple(hand for other, hand in enumerate(hands) if other != seat)
+        return hands[self.landlord],
+
+    def plays_out(self, hand: int, threats: tuple) -> bool:
+        """
+        whether a leading hand wins without letting anyone else lead: it can play moves no threat beats
+        until one move empties it
+        """
+        key = hand, threats
+        result = self.play_outs.get(key)
+        if result is None:
+            self.count_node()
+            moves = legal_move_ids(hand, 0, self.rule)
+            result = hand in moves or any(not any(beats(threat, move) for threat in threats)
+                                          and self.plays_out(hand - move, threats) for move in moves)
+            if len(self.play_outs) >= self.table_size:
+                self.play_outs.clear()
+            self.play_outs[key] = result
+        return result
+
+    def key(self, hands: tuple, to_move: int, rival_move: int, last) -> int:
+        """
+        the hands, the rival move and the turn packed in one int. When no hand has a chain, only the order of the
+        ranks matters, so the ranks nobody holds are left out and positions that only differ by them share a key
+        >>> solver = DoubleDummySolver()
+        >>> positions = [([3, 5, 5], [4, 9], [16]), ([3, 6, 6], [4, 12], [30])]
+        >>> len({solver.key(tuple(map(move_id, hands)), 0, 0, None) for hands in positions})
+        1
+        """
+        turn = to_move * 4 + (3 if last is None else last)
+        if not (chain_ranks(hands[0]) or chain_ranks(hands[1]) or chain_ranks(hands[2])):
+            # the rocket is the only move that needs particular ranks once there are no chains
+            turn += 32 if any(map(has_rocket, hands)) else 16
+            used = presence(hands[0]) | presence(hands[1]) | presence(hands[2]) | presence(rival_move)
+            hands = tuple(compress(hand, used) for hand in hands)
+            rival_move = compress(rival_move, used)
+        return hands[0] | hands[1] << 45 | hands[2] << 90 | rival_move << 135 | turn << 180
+
+    def ordered_moves(self, hands: tuple, to_move: int, rival_move: int, last, moves: tuple, safe: set) -> list:
+        """
+        the moves to try, one of each set of swapped ones (see collapse): first the ones no threat beats,
+        then the ones that leave the fewest moves to play out, then longer ones.
+        A pass is 0, when passes are voluntary it comes first over a teammate's move and last otherwise
+        """
+        hand = hands[to_move]
+        others = presence(hands[(to_move + 1) % 3]) | presence(hands[(to_move + 2) % 3])
+        ordered = sorted(collapse(moves, hand, others), reverse=True,
+                         key=lambda move: (move in safe, -min_moves(hand - move), card_count(move)))
+        if rival_move and self.voluntary_pass:
+            if to_move != self.landlord and last != self.landlord:
+                ordered.insert(0, 0)
+            else:
+                ordered.append(0)
+        return ordered
+
+    def search(self, hands: tuple, to_move: int, rival_move: int, last) -> bool:
+        """:return: True when the landlord wins"""
+        self.count_node()
+        # passes without a legal move are no choice, so they are played here instead of in positions of their own
+        while rival_move and to_move != last and not beats(hands[to_move], rival_move):
+            to_move = (to_move + 1) % 3
+        if rival_move and to_move == last:
+            # both other players passed, the round is over and the player leads
+            rival_move, last = 0, None
+        key = self.key(hands, to_move, rival_move, last)
+        result = self.table.get(key)
+        if result is None:
+            result = self.old_table.get(key)
+        if result is not None:
+            return result
+
+        hand = hands[to_move]
+        is_landlord = to_move == self.landlord
+        next_seat = (to_move + 1) % 3
+        moves = legal_move_ids(hand, rival_move, self.rule)
+        threats = self.threats(hands, to_move)
+        safe = {move for move in moves if not any(beats(threat, move) for threat in threats)}
+        # a cheap early win: the hand is played out in one move, or in moves nobody beats and a last one
+        if hand in moves or any(self.plays_out(hand - move, threats) for move in safe):
+            result = is_landlord
+        else:
+            result = not is_landlord
+            for move in self.ordered_moves(hands, to_move, rival_move, last, moves, safe):
+                if move:
+                    rest = list(hands)
+                    rest[to_move] = hand - move
+                    child = self.search(tuple(rest), next_seat, move, to_move)
+                else:
+                    child = self.search(hands, next_seat, rival_move, last)
+                # alpha-beta on a won/lost result: the first winning move of the side to move decides the node
+                if child == is_landlord:
+                    result = child
+                    break
+
+        if len(self.table) >= self.table_size:
+            self.old_table, self.table = self.table, {}
+        self.table[key] = result
+        return result
+
+
+def root_positions(deal: dict) -> list:
+    """
+    the positions after each first move of the landlord, the units that are split across processes.
+    They are ordered like the moves of the search, so a winning first move tends to come early
+    :param deal: a stored deal
+    :return: a list of (first move, hands, seat to move, rival move, seat of the rival move), the game is decided
+             right after a first move that empties the hand, which has hands None
+    >>> root_positions({'hands': [[3, 3], [4], [5]], 'landlord': 0, 'rule': 0})
+    [((3, 3), None, 0, (), None), ((3,), ((3,), (4,), (5,)), 1, (3,), 0)]
+    """
+    hands = tuple(move_id(hand) for hand in deal['hands'])
+    landlord, rule = deal['landlord'], deal['rule']
+    own = hands[landlord]
+    peasants = [hand for seat, hand in enumerate(hands) if seat != landlord]
+    moves = collapse(legal_move_ids(own, 0, rule), own, presence(peasants[0]) | presence(peasants[1]))
+    moves.sort(reverse=True, key=lambda move: (not any(beats(hand, move) for hand in peasants),
+                                               -min_moves(own - move), card_count(move)))
+    positions = []
+    for move in moves:
+        cards = tuple(move_from_id(move))
+        if move == own:
+            positions.append((cards, None, landlord, (), None))
+            continue
+        rest = list(hands)
+        rest[landlord] = own - move
+        rest = tuple(tuple(move_from_id(hand)) for hand in rest)
+        if rule == SPECIAL_RULE3:
+            # the landlord plays an additional move before the game, then leads the first round
+            positions.append((cards, rest, landlord, (), None))
+        else:
+            positions.append((cards, rest, (landlord + 1) % 3, cards, landlord))
+    return positions
+
+
+def solve_position(landlord: int, rule: int, position: tuple, max_nodes: int, deadline: float,
+                   voluntary_pass=False) -> tuple:
+    """
+    solves one root position, in a worker process or in this one
+    :param deadline: time.time() when the deal runs out of time
+    :return: (result, nodes)
+    """
+    move, hands, to_move, rival_move, last = position
+    if hands is None:
+        return LANDLORD_WINS, 1
+    if _stop is not None and _stop.is_set():
+        return UNKNOWN, 0
+    solver = _worker_solver(rule, voluntary_pass)
+    solver.max_nodes, solver.timeout = max_nodes, deadline - time.time()
+    solver.stop, solver.shared_nodes = _stop, _deal_nodes
+    return solver.solve(hands, landlord, to_move, rival_move, last), solver.nodes
+
+
+# in worker processes: set to stop all the root positions of a deal, and the nodes they searched together
+_stop = None
+_deal_nodes = None
+
+
+def _init_worker(stop, deal_nodes) -> None:
+    global _stop, _deal_nodes
+    _stop, _deal_nodes = stop, deal_nodes
+
+
+@lru_cache(maxsize=None)
+def _worker_solver(rule: int, voluntary_pass: bool) -> DoubleDummySolver:
+    """one solver per process and rule, so the transposition table is reused across the root positions"""
+    return DoubleDummySolver(rule, voluntary_pass=voluntary_pass)
+
+
+def combine(results: list):
+    """
+    the result of the root from the results of its positions: the landlord picks the first move
+    >>> combine([0, None, 1]), combine([0, None]), combine([0, 0])
+    (1, None, 0)
+    """
+    if LANDLORD_WINS in results:
+        return LANDLORD_WINS
+    if UNKNOWN in results:
+        return UNKNOWN
+    return PEASANTS_WIN
+
+
+def solve_deals(deals: list, max_nodes=2_000_000, timeout=60.0, workers=1, voluntary_pass=False):
+    """
+    solves deals one after another, splitting the root positions of each deal across worker processes.
+    The node budget and the timeout of a deal are shared by its root positions: in this process they are searched
+    in rounds with a growing share of the nodes. Worker processes add up the nodes they search and all stop
+    within about 1024 nodes each once max_nodes are used or a first move wins.
+    :param deals: a list of stored deals
+    :param workers: processes, 1 solves in this process
+    :return: yields a dict per deal with the result, the nodes searched and the seconds
+    >>> deals = [{'hands': [[3, 3], [4], [5]], 'landlord': 0, 'rule': 0},
+    ...          {'hands': [[3, 4], [5, 6], [16]], 'landlord': 0, 'rule': 0}]
+    >>> [r['result'] for r in solve_deals(deals)]
+    [1, 0]
+    """
+    executor = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        stop, deal_nodes = multiprocessing.Event(), multiprocessing.Value('q', 0)
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(stop, deal_nodes))
+    try:
+        for deal in deals:
+            start = time.time()
+            deadline = start + timeout
+            positions = root_positions(deal)
+            results = []
+            nodes = 0
+            if executor is None:
+                # rounds over the root positions still unknown with 4 times the nodes of the round before,
+                # so a first move that wins quickly is not stuck behind one that takes the whole budget
+                unknown = positions
+                share = max(max_nodes // (16 * len(positions)), 1)
+                while unknown and LANDLORD_WINS not in results and nodes < max_nodes and time.time() < deadline:
+                    last_round = nodes + share * len(unknown) >= max_nodes
+                    left = []
+                    for n, position in enumerate(unknown):
+                        if LANDLORD_WINS in results or nodes >= max_nodes or time.time() > deadline:
+                            left += unknown[n:]
+                            break
+                        result, used = solve_position(deal['landlord'], deal['rule'], position,
+                                                      max_nodes - nodes if last_round else share, deadline,
+                                                      voluntary_pass)
+                        nodes += used
+                        if result is UNKNOWN:
+                            left.append(position)
+                        else:
+                            results.append(result)
+                    unknown = left
+                    share *= 4
+                if unknown and LANDLORD_WINS not in results:
+                    results.append(UNKNOWN)
+            else:
+                from concurrent.futures import FIRST_COMPLETED, wait
+                stop.clear()
+                deal_nodes.value = 0
+                pending = {executor.submit(solve_position, deal['landlord'], deal['rule'], position, max_nodes,
+                                           deadline, voluntary_pass) for position in positions}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if not future.cancelled():
+                            result, used = future.result()
+                            results.append(result)
+                            nodes += used
+                    if LANDLORD_WINS in results and not stop.is_set():
+                        # the running positions see the Event within 1024 nodes
+                        stop.set()
+                        for future in pending:
+                            future.cancel()
+            yield {'result': combine(results), 'nodes': nodes, 'seconds': time.time() - start}
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def record_deals(filename: str, games: int, landlord_lv=0, peasants_lv=0, rule=ORIGINAL_RULE,
+                 bidding=BID_HAND_POINTS, seed=None) -> None:
+    """
+    deals games, plays them with the levels and stores the deals with the heuristic winners as JSON lines
+    """
+    if seed is not None:
+        random.seed(seed)
+    with open(filename, 'w', encoding='utf-8') as f:
+        for _ in range(games):
+            players = [Player() for _ in range(3)]
+            set_up_new_game(players, landlord_lv=landlord_lv, peasants_lv=peasants_lv, bidding=bidding)
+            deal = {'hands': [list(player.hand.cards) for player in players],
+                    'landlord': [player.character for player in players].index(LANDLORD),
+                    'rule': rule, 'landlord_lv': landlord_lv, 'peasants_lv': peasants_lv}
+            deal['winner'] = play_a_game(players, rule)
+            f.write(json.dumps(deal) + '\n')
+
+
+def load_deals(filename: str) -> list:
+    with open(filename, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    import argparse
+    import csv
+    parser = argparse.ArgumentParser(description='Record deals or solve them double-dummy')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='deal and play games, store the deals as JSON lines')
+    record_parser.add_argument('deals_file')
+    record_parser.add_argument('--games', type=int, default=100)
+    record_parser.add_argument('--landlord-lv', type=int, default=2)
+    record_parser.add_argument('--peasants-lv', type=int, default=4)
+    record_parser.add_argument('--rule', type=int, default=ORIGINAL_RULE)
+    record_parser.add_argument('--seed', type=int, default=597)
+    solve_parser = subparsers.add_parser('solve', help='solve stored deals, write a csv next to them')
+    solve_parser.add_argument('deals_file')
+    solve_parser.add_argument('--max-nodes', type=int, default=2_000_000)
+    solve_parser.add_argument('--timeout', type=float, default=60.0)
+    solve_parser.add_argument('--workers', type=int, default=1)
+    solve_parser.add_argument('--voluntary-pass', action='store_true',
+                              help='allow passing with a legal move, as in the real game, instead of only without one '
+                                   'like the simulation')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_deals(args.deals_file, args.games, args.landlord_lv, args.peasants_lv, args.rule, seed=args.seed)
+    else:
+        stored_deals = load_deals(args.deals_file)
+        rows = []
+        for n, (stored_deal, solved) in enumerate(zip(stored_deals, solve_deals(
+                stored_deals, args.max_nodes, args.timeout, args.workers, args.voluntary_pass))):
+            rows.append({'deal': n, 'heuristic_winner': stored_deal.get('winner'), **solved})
+            print(rows[-1])
+        with open(args.deals_file.rsplit('.', 1)[0] + '_double_dummy.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+
+        heuristic = sum(row['heuristic_winner'] == LANDLORD for row in rows) / len(rows)
+        print(f'Heuristic landlord win rate: {heuristic:.2%} over {len(rows)} deals')
+        # the search mostly finishes by finding a landlord win, so the solved deals alone are no fair sample:
+        # the unknown deals count as peasant wins for the lower bound and as landlord wins for the upper one
+        wins = sum(row['result'] == LANDLORD_WINS for row in rows)
+        unknown = sum(row['result'] is UNKNOWN for row in rows)
+        print(f'Double-dummy landlord win rate: between {wins / len(rows):.2%} and '
+              f'{(wins + unknown) / len(rows):.2%} over {len(rows)} deals, {unknown} unknown')
@@ -2,9 +2,16 @@
 
 from objects import *
 from constants import *
-from game_moves import MoveGeneration
+from game_moves import MoveGeneration, can_beat, rank_masks
+from hand_features import bid_weights
+from policies import Decision, QuantilePolicy
+from collections import Counter
+from functools import lru_cache
 import random
 
+# how often make_decision answered a rival move with a forced pass without generating moves
+forced_pass_stats = {'checks': 0, 'forced_passes': 0}
+
 
 def deal_cards(cards: list, player1: Player(), player2: Player(), player3: Player()) -> None:
     """
@@ -28,12 +35,48 @@ def deal_cards(cards: list, player1: Player(), player2: Player(), player3: Playe
         player3.hand.cards.append(cards.pop())
 
 
-def set_up_new_game(players: list[Player()], landlord_lv=0, peasants_lv=0) -> None:
+@lru_cache(maxsize=None)
+def quantile_policy(strength: int) -> QuantilePolicy:
+    """
+    the shared QuantilePolicy of a strength, so that games with the same levels can be batched together
+    >>> quantile_policy(3) is quantile_policy(3)
+    True
+    """
+    return QuantilePolicy(strength)
+
+
+def reset_forced_pass_stats() -> None:
+    """
+    zeroes the forced pass counters, e.g. at the start of a simulation
+    >>> forced_pass_stats['checks'] = 5
+    >>> reset_forced_pass_stats()
+    >>> forced_pass_stats, forced_pass_rate()
+    ({'checks': 0, 'forced_passes': 0}, 0.0)
+    """
+    for k in forced_pass_stats:
+        forced_pass_stats[k] = 0
+
+
+def forced_pass_rate() -> float:
+    """the share of decisions against a rival move that were forced passes, 0 before any"""
+    return forced_pass_stats['forced_passes'] / forced_pass_stats['checks'] if forced_pass_stats['checks'] else 0.0
+
+
+def get_policy(player: Player()):
+    """the policy of a player, players without one play the original way with their strength"""
+    return player.policy if player.policy is not None else quantile_policy(player.strength)
+
+
+def set_up_new_game(players: list[Player()], landlord_lv=0, peasants_lv=0, bidding=BID_HAND_POINTS,
+                    landlord_policy=None, peasants_policy=None) -> None:
     """
     create a new deck of shuffled cards, deal 51 to players, bid for the landlord, deal the last 3 cards to the landlord
     :param players: a list of 3 player objects
     :param landlord_lv: the strength of the character, ranges from 0 to 9
     :param peasants_lv: the strength of the character, ranges from 0 to 9
+    :param bidding: BID_HAND_POINTS bids by the sum of cards, BID_HAND_FEATURES by the moves a hand has
+    :param landlord_policy: a Policy object for the landlord, defaulted to the QuantilePolicy of landlord_lv
+    :param peasants_policy: a Policy object for the peasants, defaulted to the QuantilePolicy of peasants_lv
     >>> a = [Player() for _ in range(3)]
     >>> set_up_new_game(a)
     >>> len(a[0].hand.cards) + len(a[1].hand.cards) + len(a[2].hand.cards)
@@ -50,22 +93,30 @@ def set_up_new_game(players: list[Player()], landlord_lv=0, peasants_lv=0) -> No
     for player in players:
         player.update_hand_points()
 
-    # Start bidding (maybe change points to moves available)
-    player_handpoints = [player.hand_points for player in players]
-    landlord_player_index = player_handpoints.index(random.choices(
-        player_handpoints,
-        weights=[n**2 for n in player_handpoints]
-    )[0])
+    # Start bidding
+    if bidding == BID_HAND_FEATURES:
+        landlord_player_index = random.choices(
+            range(3),
+            weights=bid_weights([player.hand.cards for player in players], bidding)
+        )[0]
+    else:
+        player_handpoints = [player.hand_points for player in players]
+        landlord_player_index = player_handpoints.index(random.choices(
+            player_handpoints,
+            weights=[n**2 for n in player_handpoints]
+        )[0])
     players[landlord_player_index].assign_character(LANDLORD)
     players[(landlord_player_index+1) % 3].assign_character(PEASANT_1)
     players[(landlord_player_index+2) % 3].assign_character(PEASANT_2)
 
-    # Assigning the strength of characters
+    # Assigning the strength and policy of characters
     for player in players:
         if player.character == LANDLORD:
             player.strength = landlord_lv
+            player.policy = landlord_policy or quantile_policy(landlord_lv)
         else:
             player.strength = peasants_lv
+            player.policy = peasants_policy or quantile_policy(peasants_lv)
 
     # Add the 3 cards left in new_deck to the landlord (different with normal, peasants don't know the 3 cards here)
     players[landlord_player_index].hand.cards.extend([new_deck.cards.pop() for _ in range(3)])
@@ -75,13 +126,55 @@ def set_up_new_game(players: list[Player()], landlord_lv=0, peasants_lv=0) -> No
         player.hand.cards.sort()
 
 
-def play_a_move(player_hand: Deck(), move_list: list, strength=0, rule=0) -> list:
+def get_rival_move(move_list: list) -> list:
+    """
+    the move a player has to beat, [] if the player leads
+    >>> get_rival_move([[3], [5], []])
+    [5]
+    >>> get_rival_move([])
+    []
+    """
+    rival_move = []
+    if len(move_list) != 0:
+        if len(move_list[-1]) == 0:
+            rival_move = move_list[-2]
+        else:
+            rival_move = move_list[-1]
+    return rival_move
+
+
+def make_decision(player: Player(), move_list: list, rule=0) -> Decision:
+    """
+    generates legal moves for a player and wraps them with the state as a Decision.
+    Against a rival move, a hand that cannot beat it (see can_beat) passes without generating moves
+    >>> a = Player()
+    >>> a.hand.cards = [5, 6, 6]
+    >>> make_decision(a, [[5, 5]]).moves
+    [[6, 6]]
+    >>> make_decision(a, [[7, 7], []]).moves
+    []
+    """
+    rival_move = get_rival_move(move_list)
+    masks = None
+    if rival_move:
+        forced_pass_stats['checks'] += 1
+        masks = rank_masks(Counter(player.hand.cards))
+        if not can_beat(masks, rival_move):
+            forced_pass_stats['forced_passes'] += 1
+            return Decision([], player.hand.cards, rival_move, move_list, player.character, rule)
+    move_generator = MoveGeneration(player.hand.cards, rival_move, rule, masks)
+    move_generator.generate_move()
+    return Decision(move_generator.new_move, player.hand.cards, rival_move, move_list, player.character, rule)
+
+
+def play_a_move(player_hand: Deck(), move_list: list, strength=0, rule=0, policy=None) -> list:
     """
     Gets last rival's move, generates legal moves, and returns a move stored in a list
     :param player_hand: A deck that a playe has
     :param move_list: The move list in the round
     :param strength: how strong a player should play
     :param rule: original = 0, special >= 1
+    :param policy: a Policy object that picks the move, defaulted to the QuantilePolicy of strength
     :return: the move played
     >>> a = Deck()
     >>> b = [[6, 6]]
@@ -89,20 +182,11 @@ def play_a_move(player_hand: Deck(), move_list: list, strength=0, rule=0) -> lis
     >>> play_a_move(a, b)
     [20, 30]
     """
-    rival_move = []
-    if len(move_list) != 0:
-        if len(move_list[-1]) == 0:
-            rival_move = move_list[-2]
-        else:
-            rival_move = move_list[-1]
-
-    move_generator = MoveGeneration(player_hand.cards, rival_move, rule)
-    move_generator.generate_move()
-    moves = move_generator.new_move
-
-    # move as a move list, modify for difference
-    idx = int(strength / 10 * len(moves))
-    move = moves[idx] if len(moves) else []
+    player = Player()
+    player.hand = player_hand
+    player.strength = strength
+    player.policy = policy
+    move = get_policy(player).choose([make_decision(player, move_list, rule)])[0]
     player_hand.remove_card_from_hand(move)
 
     return move
@@ -136,9 +220,9 @@ def check_winner(players: list[Player()]) -> int:
     return GAME_CONTINUE
 
 
-def play_a_round(players: list[Player()], rule=0, print_details=False, is_rule3_1st_round=False) -> int:
+def round_steps(players: list[Player()], rule=0, print_details=False, is_rule3_1st_round=False):
     """
-    Play a round until two people pass
+    Play a round until two people pass, as a generator that yields (player, Decision) and gets the chosen move back
     :param players: A list of playes
     :param rule: original = 0, special .= 1
     :param print_details: Prints details of the game when true
@@ -152,8 +236,8 @@ def play_a_round(players: list[Player()], rule=0, print_details=False, is_rule3_
             players[i].first_player_next_round = False
 
     if is_rule3_1st_round:
-        move = play_a_move(players[in_play_index].hand, move_list=[],
-                           strength=players[in_play_index].strength, rule=rule)
+        move = yield players[in_play_index], make_decision(players[in_play_index], [], rule)
+        players[in_play_index].hand.remove_card_from_hand(move)
         if print_details:
             player_name = char_int_to_str[players[in_play_index].character]
             print(f"Player: {player_name} plays move {move}")
@@ -166,9 +250,8 @@ def play_a_round(players: list[Player()], rule=0, print_details=False, is_rule3_
 
     move_list = []
     while len(move_list) < 2 or (move_list[-1] != [] or move_list[-2] != []):
-        # strength can be 0-9
-        move = play_a_move(players[in_play_index].hand, move_list,
-                           strength=players[in_play_index].strength, rule=rule)
+        move = yield players[in_play_index], make_decision(players[in_play_index], move_list, rule)
+        players[in_play_index].hand.remove_card_from_hand(move)
         if print_details:
             player_name = char_int_to_str[players[in_play_index].character]
             print(f"Player: {player_name} plays move {move}")
@@ -188,3 +271,140 @@ def play_a_round(players: list[Player()], rule=0, print_details=False, is_rule3_
         in_play_index = (in_play_index+1) % 3
     players[in_play_index].first_player_next_round = True
     return GAME_CONTINUE
+
+
+def new_game_record(players: list[Player()]) -> dict:
+    """
+    a game record with the counters game_steps updates
+    >>> a = [Player() for _ in range(3)]
+    >>> set_up_new_game(a)
+    >>> sorted(new_game_record(a))
+    ['bombs', 'cards_left_losers', 'landlord_points', 'rockets', 'rounds', 'turns', 'winner']
+    """
+    landlord_points = sum(player.hand.get_deck_points() for player in players if player.character == LANDLORD)
+    return {'winner': GAME_CONTINUE, 'rounds': 0, 'turns': 0, 'bombs': 0, 'rockets': 0,
+            'cards_left_losers': 0, 'landlord_points': landlord_points}
+
+
+def game_steps(players: list[Player()], rule=0, print_details=False, record=None):
+    """
+    Play rounds until a winner exists, as a generator like round_steps
+    :param record: a dict from new_game_record, updated with the rounds, turns, bombs and the result when given
+    :return: LANDLORD or PEASANT
+    """
+    is_rule3_1st_round = rule == SPECIAL_RULE3
+    while True:
+        steps = round_steps(players, rule, print_details=print_details, is_rule3_1st_round=is_rule3_1st_round)
+        is_rule3_1st_round = False
+        try:
+            request = next(steps)
+            while True:
+                move = yield request
+                if record is not None:
+                    record['turns'] += 1
+                    record['bombs'] += len(move) == 4 and len(set(move)) == 1
+                    record['rockets'] += move == [20, 30]
+                request = steps.send(move)
+        except StopIteration as stop:
+            round_result = stop.value
+        if record is not None:
+            record['rounds'] += 1
+        if round_result != GAME_CONTINUE:
+            if record is not None:
+                record['winner'] = round_result
+                record['cards_left_losers'] = sum(
+                    player.hand.get_deck_length() for player in players
+                    if (player.character == LANDLORD) == (round_result == PEASANT))
+            return round_result
+
+
+def drive_steps(steps) -> int:
+    """
+    Runs a round_steps or game_steps generator to the end, each decision goes to the policy of its player
+    :return: the return value of the generator
+    """
+    try:
+        player, decision = next(steps)
+        while True:
+            player, decision = steps.send(get_policy(player).choose([decision])[0])
+    except StopIteration as stop:
+        return stop.value
+
+
+def play_a_round(players: list[Player()], rule=0, print_details=False, is_rule3_1st_round=False) -> int:
+    """
+    Play a round until two people pass
+    :param players: A list of playes
+    :param rule: original = 0, special .= 1
+    :param print_details: Prints details of the game when true
+    :param is_rule3_1st_round: Landlord plays an additional move before game when true (only used in SPECIAL_RULE3)
+    :return: Returns an int that represents a winner or game continue
+    """
+    return drive_steps(round_steps(players, rule, print_details, is_rule3_1st_round))
+
+
+def play_a_game(players: list[Player()], rule=0, print_details=False) -> int:
+    """
+    Play rounds until a winner exists
+    :param players: A list of players after set_up_new_game
+    :param rule: original = 0, special >= 1
+    :param print_details: Prints details of the game when true
+    :return: LANDLORD or PEASANT
+    >>> a = [Player() for _ in range(3)]
+    >>> set_up_new_game(a)
+    >>> play_a_game(a) in (LANDLORD, PEASANT)
+    True
+    """
+    return drive_steps(game_steps(players, rule, print_details))
+
+
+def play_games(games: list, rule=0, print_details=False, records=None, exporter=None) -> list:
+    """
+    Play many games in lockstep, so that every policy gets the pending decisions of all games in one choose call
+    :param games: a list of player lists after set_up_new_game
+    :param rule: original = 0, special >= 1
+    :param print_details: Prints details of the games when true
+    :param records: a list that gets one game record (see new_game_record) per game when given
+    :param exporter: a ShardWriter (see dataset_export.py) that gets every decision and the outcome when given
+    :return: a list of winners, LANDLORD or PEASANT, in the order of games
+    >>> games = [[Player() for _ in range(3)] for _ in range(4)]
+    >>> for players in games:
+    ...     set_up_new_game(players, landlord_lv=3, peasants_lv=3)
+    >>> records = []
+    >>> winners = play_games(games, records=records)
+    >>> all(winner in (LANDLORD, PEASANT) for winner in winners), [r['winner'] for r in records] == winners
+    (True, True)
+    """
+    winners = [GAME_CONTINUE] * len(games)
+    steps = {}
+    pending = {}
+    exported = {}  # game index: game number of the exporter
+    for k, players in enumerate(games):
+        if exporter is not None:
+            exported[k] = exporter.start_game(players, rule)
+        record = None
+        if records is not None:
+            record = new_game_record(players)
+            records.append(record)
+        steps[k] = game_steps(players, rule, print_details, record)
+        pending[k] = next(steps[k])
+
+    while pending:
+        batches = {}  # id of policy: (policy, game indices)
+        for k, (player, decision) in pending.items():
+            policy = get_policy(player)
+            batches.setdefault(id(policy), (policy, []))[1].append(k)
+
+        for policy, ks in batches.values():
+            moves = policy.choose([pending[k][1] for k in ks])
+            for k, move in zip(ks, moves):
+                if exporter is not None:
+                    exporter.add(exported[k], pending[k][0], pending[k][1], move)
+                try:
+                    pending[k] = steps[k].send(move)
+                except StopIteration as stop:
+                    winners[k] = stop.value
+                    del pending[k]
+                    if exporter is not None:
+                        exporter.end_game(exported[k], winners[k])
+    return winners
@@ -2,7 +2,8 @@
 
 from collections import Counter
 from constants import *
-from itertools import combinations
+from functools import lru_cache
+from itertools import combinations, islice
 
 
 def is_continuous(move: list) -> bool:
@@ -104,15 +105,186 @@ def get_move_type(move: list) -> dict:
                 return {'type': TYPE_14_4_22, 'rank': [num for num, cnt in move_dict.items() if cnt == 4].pop()}
 
 
+# Rank-presence bitboards: bit n is set when card n is in the hand, so a chain is a run of set bits.
+# 2 (16) and the kings (20, 30) are never next to A (14) since bit 15 is never set.
+CHAIN_BITS = sum(1 << card for card in range(3, 15))
+ROCKET_BITS = 1 << 20 | 1 << 30
+
+
+def rank_masks(cards_dict: dict) -> dict:
+    """
+    bitboards of the ranks with at least 1, 2, 3 and exactly 4 copies in a hand
+    :param cards_dict: a Counter of the cards
+    :return: a dict of {1: >=1, 2: >=2, 3: >=3, 4: ==4}
+    >>> masks = rank_masks(Counter([3, 3, 3, 3, 4, 4, 5, 16]))
+    >>> [bin(masks[i]) for i in range(1, 5)]
+    ['0b10000000000111000', '0b11000', '0b1000', '0b1000']
+    """
+    masks = {1: 0, 2: 0, 3: 0, 4: 0}
+    for card, count in cards_dict.items():
+        bit = 1 << card
+        for i in range(1, min(count, 3) + 1):
+            masks[i] |= bit
+        if count == 4:
+            masks[4] |= bit
+    return masks
+
+
+def iter_bits(mask: int):
+    """
+    yields the set bits of a mask from low to high, i.e. the cards in ascending order
+    >>> list(iter_bits(0b101001000))
+    [3, 6, 8]
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def serial_starts(mask: int, length: int) -> int:
+    """
+    shift-and-AND for the start cards of all chains of a length
+    :param mask: a rank-presence bitboard
+    :param length: the length of the chains
+    :return: a bitboard with the start cards of the chains set
+    >>> list(iter_bits(serial_starts(0b111110111111000, 5)))
+    [3, 4, 10]
+    """
+    chain = mask & CHAIN_BITS
+    starts = chain
+    for i in range(1, length):
+        starts &= chain >> i
+    return starts
+
+
+def run_length(mask: int, start: int) -> int:
+    """
+    how many consecutive chain cards from start card are set in a mask
+    >>> run_length(0b111110111111000, 5)
+    4
+    """
+    chain = (mask & CHAIN_BITS) >> start
+    return (chain ^ (chain + 1)).bit_length() - 1
+
+
+def iter_kickers(pool: list, count: int, cap=MAX_KICKER_COMBINATIONS):
+    """
+    lazily yields kicker sets in sorted order, each set is a sorted tuple without duplicates
+    :param pool: sorted unique cards that can be kickers
+    :param count: how many kickers a set has
+    :param cap: the hard limit of sets to enumerate
+    >>> list(iter_kickers([3, 5, 8], 2))
+    [(3, 5), (3, 8), (5, 8)]
+    >>> list(iter_kickers([3, 5, 8], 2, cap=1))
+    [(3, 5)]
+    """
+    return islice(combinations(pool, count), cap)
+
+
+def iter_kicker_moves(body: list, pool: list, count: int, width=1, cap=MAX_KICKER_COMBINATIONS):
+    """
+    lazily yields sorted moves of a body with every kicker set, kicker sets from a unique pool never repeat
+    :param body: the sorted main part of the move, e.g. [4, 4, 4] or a plane
+    :param pool: sorted unique cards that can be kickers, not including cards of the body
+    :param count: how many kickers a move has
+    :param width: 1 for single kickers, 2 for pair kickers
+    :param cap: the hard limit of kicker sets to enumerate
+    >>> list(iter_kicker_moves([5, 5, 5], [3, 8], 1, width=2))
+    [[3, 3, 5, 5, 5], [5, 5, 5, 8, 8]]
+    """
+    return (sorted(body + list(kickers * width)) for kickers in iter_kickers(pool, count, cap))
+
+
+@lru_cache(maxsize=4096)
+def rival_profile(rival_move: tuple) -> tuple:
+    """
+    what a hand has to beat, read from a rival move the same way the gen methods read it
+    :param rival_move: a sorted non-empty move as a tuple
+    :return: (move type, rank to beat, chain length), the chain length is 0 for moves without a chain
+    >>> rival_profile((3, 4, 4, 4))
+    (6, 4, 0)
+    >>> rival_profile((3, 4, 4, 4, 5, 5, 5, 6))
+    (11, 3, 2)
+    """
+    move_type = get_move_type(list(rival_move))['type']
+    counts = Counter(rival_move)
+    rank = rival_move[0]
+    length = 0
+    if move_type in (TYPE_6_3_1, TYPE_7_3_2):
+        rank = [x for x in rival_move if counts[x] == 3][0]
+    elif move_type in (TYPE_13_4_2, TYPE_14_4_22):
+        rank = [x for x in rival_move if counts[x] == 4][0]
+    elif move_type == TYPE_16_2_1:
+        rank = [x for x in rival_move if counts[x] == 2][0]
+    elif move_type == TYPE_17_2_2_1:
+        rank = max(x for x in rival_move if counts[x] == 2)
+    elif TYPE_8_SERIAL_SINGLE <= move_type <= TYPE_12_SERIAL_3_2:
+        repeat = min(move_type - 7, 3)
+        length = sum(v >= repeat for v in counts.values())
+    return move_type, rank, length
+
+
+def can_beat(masks: dict, rival_move: list) -> bool:
+    """
+    whether generate_move finds any move against a rival move, from the rank bitboards only.
+    It answers exactly like bool(new_move) so forced passes can skip the generation.
+    The rule is not needed: it only adds move types, and a rival move of such a type exists only under its rule.
+    :param masks: the rank_masks of the hand
+    :param rival_move: a non-empty rival move
+    >>> can_beat(rank_masks(Counter([5, 6, 6])), [5, 5])
+    True
+    >>> can_beat(rank_masks(Counter([5, 6, 6])), [7, 7])
+    False
+    >>> can_beat(rank_masks(Counter([3, 4, 4, 4, 8])), [3, 3, 3, 5])
+    True
+    """
+    move_type, rank, length = rival_profile(tuple(rival_move))
+    above = ~((2 << rank) - 1)  # the bits of cards higher than rank
+    # bombs are compared with the first card of any rival move, like gen_type_4_bomb
+    if masks[4] & ~((2 << rival_move[0]) - 1) or masks[1] & ROCKET_BITS == ROCKET_BITS:
+        return True
+    distinct = masks[1].bit_count()
+
+    match move_type:
+        case 1 | 2 | 3:
+            return bool(masks[move_type] & above)
+        case 6:
+            return bool(masks[3] & above) and distinct >= 2
+        case 7:
+            return any(masks[2] & ~(1 << k) for k in iter_bits(masks[3] & above))
+        case 8 | 9 | 10:
+            return bool(serial_starts(masks[move_type - 7], length) & above)
+        case 11 | 12:
+            chain = (1 << length) - 1
+            for start in iter_bits(serial_starts(masks[3], length) & above):
+                if move_type == TYPE_11_SERIAL_3_1 and distinct - length >= length:
+                    return True
+                if move_type == TYPE_12_SERIAL_3_2 and (masks[2] & ~(chain << start)).bit_count() >= length:
+                    return True
+            return False
+        case 13:
+            return bool(masks[4] & above) and distinct >= 3
+        case 14:
+            return any((masks[2] & ~(1 << k)).bit_count() >= 2 for k in iter_bits(masks[4] & above))
+        case 16:
+            return bool(masks[2] & above) and distinct >= 2
+        case 17:
+            return masks[2].bit_length() - 1 > rank and masks[2].bit_count() >= 2 and distinct >= 3
+    return False
+
+
 class MoveGeneration:
     """generate legal moves
     this class was inspired by https://github.com/kwai/DouZero and has referenced some code from it
     """
 
-    def __init__(self, cards, rival_move, rule=0):
+    def __init__(self, cards, rival_move, rule=0, masks=None):
+        """:param masks: the rank_masks of the cards when the caller has them already, computed otherwise"""
         self.cards = cards
         self.cards_unique = sorted(list(set(self.cards)))
         self.cards_dict = Counter(cards)
+        self.masks = rank_masks(self.cards_dict) if masks is None else masks
         self.rival_move = rival_move
         self.rival_move_length = len(rival_move)
         self.new_move = []
@@ -232,8 +404,8 @@ class MoveGeneration:
         >>> mg.new_move
         []
         """
-        for k, v in self.cards_dict.items():
-            if v == 4 and (not self.rival_move_length or k > self.rival_move[0]):
+        for k in iter_bits(self.masks[4]):
+            if not self.rival_move_length or k > self.rival_move[0]:
                 self.new_move.append([k, k, k, k])
 
     def gen_type_5_king_bomb(self):
@@ -254,13 +426,10 @@ class MoveGeneration:
         [[4, 5, 5, 5], [5, 5, 5, 6], [5, 5, 5, 8]]
         """
         rival_3 = [x for x in self.rival_move if Counter(self.rival_move)[x] == 3][0] if self.rival_move_length else 0
-        for k, v in self.cards_dict.items():
-            if v >= 3 and k > rival_3:
-                for i in self.cards:
-                    if i != k and [k, k, k, i] not in self.new_move:
-                        self.new_move.append([k, k, k, i])
-        for i in self.new_move:
-            i.sort()
+        for k in iter_bits(self.masks[3]):
+            if k > rival_3:
+                one_cards = [x for x in self.cards_unique if x != k]
+                self.new_move.extend(iter_kicker_moves([k, k, k], one_cards, 1))
 
     def gen_type_7_3_2(self):
         """
@@ -271,13 +440,10 @@ class MoveGeneration:
         [[4, 4, 4, 5, 5], [4, 4, 4, 6, 6], [4, 4, 4, 8, 8], [4, 4, 5, 5, 5], [5, 5, 5, 6, 6], [5, 5, 5, 8, 8]]
         """
         rival_3 = [x for x in self.rival_move if Counter(self.rival_move)[x] == 3][0] if self.rival_move_length else 0
-        for k, v in self.cards_dict.items():
-            if v >= 3 and k > rival_3:
-                for i, j in self.cards_dict.items():
-                    if i != k and j >= 2 and [k, k, k, i, i] not in self.new_move:
-                        self.new_move.append([k, k, k, i, i])
-        for i in self.new_move:
-            i.sort()
+        for k in iter_bits(self.masks[3]):
+            if k > rival_3:
+                two_cards = [x for x in iter_bits(self.masks[2]) if x != k]
+                self.new_move.extend(iter_kicker_moves([k, k, k], two_cards, 1, width=2))
 
     def gen_serial(self, move_type, min_chain):
         """
@@ -285,31 +451,34 @@ class MoveGeneration:
         :param move_type: [3, 4, 5, 6, 7] is TYPE_8_SERIAL_SINGLE, [3, 3, 4, 4, 5, 5] is TYPE_9_SERIAL_PAIR
         :param min_chain: how many sequential numbers to form a chain
         """
+        self.new_move.extend(self.serial_moves(move_type, min_chain))
+
+    def serial_moves(self, move_type, min_chain) -> list:
+        """
+        chains found from the rank bitboards, ordered by start card then length
+        :param move_type: TYPE_8_SERIAL_SINGLE, TYPE_9_SERIAL_PAIR or TYPE_10_SERIAL_TRIPLE
+        :param min_chain: how many sequential numbers to form a chain
+        :return: a list of moves
+        >>> MoveGeneration([3, 3, 4, 4, 5, 5, 6, 6, 7], []).serial_moves(TYPE_9_SERIAL_PAIR, MIN_SERIAL_PAIR)
+        [[3, 3, 4, 4, 5, 5], [3, 3, 4, 4, 5, 5, 6, 6], [4, 4, 5, 5, 6, 6]]
+        """
         # single = 8 - 7 == 1, pair == 2, triple == 3
         repeat = move_type - 7
-        card_set = []
-        for k, v in self.cards_dict.items():
-            if v >= repeat:
-                card_set.append(k)
-
-        for start_card in card_set:
-            if start_card > 15 - min_chain:
-                break
-
-            if self.rival_move_length == 0:
-                # can generate length 5-12 cards for serial_single, 3-10 serial pair, 2-6 serial triple
-                for length in range(min_chain, len(card_set) + 1):
-                    possible_chain = [start_card + x for x in range(length)]
-                    if all(x in card_set for x in possible_chain):
-                        self.new_move.append(sorted(possible_chain * repeat))
-            else:
-                rival_move_serial_unique = []
-                for k, v in Counter(self.rival_move).items():
-                    if v >= repeat:
-                        rival_move_serial_unique.append(k)
-                possible_chain = [start_card + x for x in range(len(rival_move_serial_unique))]
-                if all(x in card_set for x in possible_chain) and possible_chain[0] > self.rival_move[0]:
-                    self.new_move.append(sorted(possible_chain * repeat))
+        mask = self.masks[repeat]
+        moves = []
+
+        if self.rival_move_length == 0:
+            # can generate length 5-12 cards for serial_single, 3-10 serial pair, 2-6 serial triple
+            for start_card in iter_bits(serial_starts(mask, min_chain)):
+                for length in range(min_chain, run_length(mask, start_card) + 1):
+                    moves.append([card for card in range(start_card, start_card + length) for _ in range(repeat)])
+        else:
+            length = sum(v >= repeat for v in Counter(self.rival_move).values())
+            # only chains starting higher than the rival move
+            starts = serial_starts(mask, length) & ~((2 << self.rival_move[0]) - 1)
+            for start_card in iter_bits(starts):
+                moves.append([card for card in range(start_card, start_card + length) for _ in range(repeat)])
+        return moves
 
     def gen_type_8_serial_single(self):
         """chain
@@ -374,19 +543,12 @@ class MoveGeneration:
         serial_3_1_moves.extend(self.new_move)
         # The above two lines saves existing self.new_move in serial_3_1_moves
         # when assigning self.new_move = serial_3_1_moves the existing moves will not be erased
-        len_1 = len(self.new_move)
-        self.gen_type_10_serial_triple()
-        len_2 = len(self.new_move)
-        serial_3_moves = self.new_move[len_1:len_2]
+        serial_3_moves = self.serial_moves(TYPE_10_SERIAL_TRIPLE, MIN_SERIAL_TRIPLE)
 
         for s3 in serial_3_moves:
             s3_set = set(s3)
             one_cards = [x for x in self.cards_unique if x not in s3_set]
-
-            one_cards_comb = [list(x) for x in combinations(one_cards, len(s3_set))]
-
-            for i in one_cards_comb:
-                serial_3_1_moves.append(sorted(s3 + i))
+            serial_3_1_moves.extend(iter_kicker_moves(s3, one_cards, len(s3_set)))
 
         self.new_move = serial_3_1_moves
 
@@ -403,20 +565,13 @@ class MoveGeneration:
         """
         serial_3_2_moves = []
         serial_3_2_moves.extend(self.new_move)
-        len_1 = len(self.new_move)
-        self.gen_type_10_serial_triple()
-        len_2 = len(self.new_move)
-        serial_3_moves = self.new_move[len_1:len_2]
-        pairs = sorted([k for k, v in self.cards_dict.items() if v >= 2])
+        serial_3_moves = self.serial_moves(TYPE_10_SERIAL_TRIPLE, MIN_SERIAL_TRIPLE)
+        pairs = list(iter_bits(self.masks[2]))
 
         for s3 in serial_3_moves:
             s3_set = set(s3)
             two_cards = [x for x in pairs if x not in s3_set]
-
-            two_cards_comb = [list(x) for x in combinations(two_cards, len(s3_set))]
-
-            for i in two_cards_comb:
-                serial_3_2_moves.append(sorted(s3 + i * 2))
+            serial_3_2_moves.extend(iter_kicker_moves(s3, two_cards, len(s3_set), width=2))
 
         self.new_move = serial_3_2_moves
 
@@ -432,23 +587,18 @@ class MoveGeneration:
         >>> mg.new_move
         [[4, 5, 5, 5, 5, 8], [4, 5, 5, 5, 5, 12], [5, 5, 5, 5, 8, 12]]
         """
-        four_cards = [k for k, v in self.cards_dict.items() if v == 4]
         type_13_4_2_moves = []
         type_13_4_2_moves.extend(self.new_move)
+        rival_4 = 0
+        if self.rival_move_length:
+            for k, v in Counter(self.rival_move).items():
+                if v == 4:
+                    rival_4 = k
 
-        for fc in four_cards:
-            one_cards = [x for x in self.cards_unique if x != fc]
-
-            one_cards_comb = [list(x) for x in combinations(one_cards, 2)]
-
-            for i in one_cards_comb:
-                rival_4 = 0
-                if self.rival_move_length:
-                    for k, v in Counter(self.rival_move).items():
-                        if v == 4:
-                            rival_4 = k
-                if not self.rival_move_length or (self.rival_move_length and fc > rival_4):
-                    type_13_4_2_moves.append(sorted([fc] * 4 + i))
+        for fc in iter_bits(self.masks[4]):
+            if not self.rival_move_length or fc > rival_4:
+                one_cards = [x for x in self.cards_unique if x != fc]
+                type_13_4_2_moves.extend(iter_kicker_moves([fc] * 4, one_cards, 2))
 
         self.new_move = type_13_4_2_moves
 
@@ -464,24 +614,19 @@ class MoveGeneration:
         >>> mg.new_move
         [[3, 3, 3, 3, 5, 5, 12, 12], [3, 3, 5, 5, 5, 5, 12, 12]]
         """
-        four_cards = [k for k, v in self.cards_dict.items() if v == 4]
         type_14_4_22_moves = []
         type_14_4_22_moves.extend(self.new_move)
-        pairs = sorted([k for k, v in self.cards_dict.items() if v >= 2])
-
-        for fc in four_cards:
-            two_cards = [x for x in pairs if x != fc]
-
-            two_cards_comb = [list(x) for x in combinations(two_cards, 2)]
-
-            for i in two_cards_comb:
-                rival_4 = 0
-                if self.rival_move_length:
-                    for k, v in Counter(self.rival_move).items():
-                        if v == 4:
-                            rival_4 = k
-                if not self.rival_move_length or (self.rival_move_length and fc > rival_4):
-                    type_14_4_22_moves.append(sorted([fc] * 4 + i + i))
+        pairs = list(iter_bits(self.masks[2]))
+        rival_4 = 0
+        if self.rival_move_length:
+            for k, v in Counter(self.rival_move).items():
+                if v == 4:
+                    rival_4 = k
+
+        for fc in iter_bits(self.masks[4]):
+            if not self.rival_move_length or fc > rival_4:
+                two_cards = [x for x in pairs if x != fc]
+                type_14_4_22_moves.extend(iter_kicker_moves([fc] * 4, two_cards, 2, width=2))
 
         self.new_move = type_14_4_22_moves
 
@@ -498,13 +643,10 @@ class MoveGeneration:
         [[4, 4, 5], [4, 4, 6], [4, 4, 8], [4, 5, 5], [5, 5, 6], [5, 5, 8], [4, 6, 6], [5, 6, 6], [6, 6, 8]]
         """
         rival_2 = [x for x in self.rival_move if Counter(self.rival_move)[x] == 2][0] if self.rival_move_length else 0
-        for k, v in self.cards_dict.items():
-            if v >= 2 and k > rival_2:
-                for i in self.cards:
-                    if i != k and [k, k, i] not in self.new_move:
-                        self.new_move.append([k, k, i])
-        for i in self.new_move:
-            i.sort()
+        for k in iter_bits(self.masks[2]):
+            if k > rival_2:
+                one_cards = [x for x in self.cards_unique if x != k]
+                self.new_move.extend(iter_kicker_moves([k, k], one_cards, 1))
 
     def gen_type_17_2_2_1(self):
         """
@@ -519,13 +661,9 @@ class MoveGeneration:
         [[4, 4, 5, 5, 6], [4, 4, 5, 5, 8], [4, 4, 5, 6, 6], [4, 4, 6, 6, 8], [4, 5, 5, 6, 6], [5, 5, 6, 6, 8]]
         """
         rival_2 = max([x for x in self.rival_move if Counter(self.rival_move)[x] == 2]) if self.rival_move_length else 0
-        pairs = sorted([k for k, v in self.cards_dict.items() if v >= 2])
-        pairs_comb = [list(x) for x in combinations(pairs, 2)]
+        pairs = list(iter_bits(self.masks[2]))
 
-        for i in pairs_comb:
+        for i in iter_kickers(pairs, 2):
             if max(i) > rival_2:
-                for j in self.cards:
-                    if j not in i and (i * 2 + [j]) not in self.new_move:
-                        self.new_move.append(i * 2 + [j])
-        for i in self.new_move:
-            i.sort()
+                one_cards = [x for x in self.cards_unique if x not in i]
+                self.new_move.extend(iter_kicker_moves([i[0], i[0], i[1], i[1]], one_cards, 1))
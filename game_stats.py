@@ -0,0 +1,160 @@
+"""This module collects game-level statistics online, in constant memory and mergeable across processes"""
+
+from constants import *
+import json
+
+
+class OnlineStats:
+    """Count, mean, variance (Welford), min, max and a fixed-bin histogram of a stream of numbers"""
+
+    def __init__(self, low: float, high: float, bins: int):
+        """
+        :param low: lower edge of the histogram
+        :param high: upper edge of the histogram, values outside are counted in the first or last bin
+        :param bins: number of bins
+        """
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = None
+        self.max = None
+        self.histogram = [0] * bins
+
+    def update(self, x: float) -> None:
+        """
+        >>> s = OnlineStats(0, 10, 5)
+        >>> for x in [1, 2, 3, 4, 12]:
+        ...     s.update(x)
+        >>> s.n, s.mean, s.variance, s.histogram
+        (5, 4.4, 19.3, [1, 2, 1, 0, 1])
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        bin_index = int((x - self.low) / (self.high - self.low) * self.bins)
+        self.histogram[min(max(bin_index, 0), self.bins - 1)] += 1
+
+    @property
+    def variance(self) -> float:
+        """sample variance"""
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def merge(self, other) -> None:
+        """
+        adds another OnlineStats with the same bins (Chan et al. parallel variance)
+        >>> a, b, c = OnlineStats(0, 10, 5), OnlineStats(0, 10, 5), OnlineStats(0, 10, 5)
+        >>> for x in [1, 2, 3]:
+        ...     a.update(x)
+        ...     c.update(x)
+        >>> for x in [4, 12]:
+        ...     b.update(x)
+        ...     c.update(x)
+        >>> a.merge(b)
+        >>> (a.n, round(a.mean, 9), round(a.variance, 9), a.histogram) == (c.n, c.mean, round(c.variance, 9), c.histogram)
+        True
+        """
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError('cannot merge statistics with different bins')
+        if not other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def to_state(self) -> dict:
+        """a json-friendly dict, e.g. to send from a worker process or to write in a sidecar file"""
+        return {'low': self.low, 'high': self.high, 'bins': self.bins, 'n': self.n, 'mean': self.mean,
+                'm2': self.m2, 'min': self.min, 'max': self.max, 'histogram': list(self.histogram)}
+
+    @classmethod
+    def from_state(cls, state: dict):
+        """
+        >>> s = OnlineStats(0, 10, 5)
+        >>> s.update(3)
+        >>> OnlineStats.from_state(s.to_state()).to_state() == s.to_state()
+        True
+        """
+        stats = cls(state['low'], state['high'], state['bins'])
+        for k in ('n', 'mean', 'm2', 'min', 'max'):
+            setattr(stats, k, state[k])
+        stats.histogram = list(state['histogram'])
+        return stats
+
+
+# name: (low, high, bins) of the histogram
+GAME_METRICS = {
+    'rounds': (0, 40, 40),
+    'turns': (0, 120, 40),
+    'bombs': (0, 8, 8),
+    'rockets': (0, 2, 2),
+    'cards_left_losers': (0, 40, 40),
+    'landlord_points_win': (100, 350, 50),
+    'landlord_points_loss': (100, 350, 50)
+}
+
+
+class GameStatsCollector:
+    """Statistics of finished games, updated with the game records from play_games"""
+
+    def __init__(self):
+        self.metrics = {name: OnlineStats(*bins) for name, bins in GAME_METRICS.items()}
+
+    def update(self, record: dict) -> None:
+        """
+        :param record: a game record, see game_steps in game_functions.py
+        >>> c = GameStatsCollector()
+        >>> c.update({'winner': LANDLORD, 'rounds': 5, 'turns': 20, 'bombs': 1, 'rockets': 0,
+        ...           'cards_left_losers': 17, 'landlord_points': 230})
+        >>> c.metrics['landlord_points_win'].n, c.metrics['landlord_points_loss'].n
+        (1, 0)
+        """
+        for name in ('rounds', 'turns', 'bombs', 'rockets', 'cards_left_losers'):
+            self.metrics[name].update(record[name])
+        outcome = 'landlord_points_win' if record['winner'] == LANDLORD else 'landlord_points_loss'
+        self.metrics[outcome].update(record['landlord_points'])
+
+    def merge(self, other) -> None:
+        for name, stats in self.metrics.items():
+            stats.merge(other.metrics[name])
+
+    def columns(self) -> dict:
+        """
+        mean and variance of every metric, as extra csv columns
+        >>> list(GameStatsCollector().columns())[:2]
+        ['rounds_mean', 'rounds_var']
+        """
+        columns = {}
+        for name, stats in self.metrics.items():
+            columns[f'{name}_mean'] = stats.mean
+            columns[f'{name}_var'] = stats.variance
+        return columns
+
+    def to_state(self) -> dict:
+        return {name: stats.to_state() for name, stats in self.metrics.items()}
+
+    @classmethod
+    def from_state(cls, state: dict):
+        collector = cls()
+        collector.metrics = {name: OnlineStats.from_state(stats) for name, stats in state.items()}
+        return collector
+
+
+def write_sidecar(filename: str, cells: list) -> None:
+    """
+    writes the full statistics (with histograms) of cells next to a results csv
+    :param filename: the json file name
+    :param cells: a list of dicts with the cell settings and 'stats', the state of a GameStatsCollector
+    """
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(cells, f)
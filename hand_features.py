@@ -0,0 +1,161 @@
+"""This module extracts features of a hand from its per-rank count vector, mainly for bidding the landlord"""
+
+from constants import *
+from functools import lru_cache
+
+HIGH_CARD_START = rank2idx[14]  # A, 2, X, D are high cards
+
+# How much a feature adds to (or takes from) the bidding score, weights follow deckTypeWeightDict
+FEATURE_WEIGHTS = {
+    'bombs': deckTypeWeightDict['Bomb'],
+    'rockets': deckTypeWeightDict['Rocket'],
+    'chains': deckTypeWeightDict['ChainSolo'],
+    'planes': deckTypeWeightDict['Plane'],
+    'high_cards': deckTypeWeightDict['Pair'],
+    'singletons': -deckTypeWeightDict['Solo']
+}
+
+
+def count_runs(present: list, min_length: int) -> tuple:
+    """
+    find maximal runs of present ranks among 3 to A
+    :param present: a list of bools, one per rank
+    :param min_length: the shortest run to count
+    :return: (number of runs, set of rank indices covered by the runs)
+    >>> count_runs([True] * 6 + [False, True, True], 5)
+    (1, {0, 1, 2, 3, 4, 5})
+    >>> count_runs([True, True, False, True, True], 2)
+    (2, {0, 1, 3, 4})
+    """
+    runs = 0
+    covered = set()
+    start = 0
+    for idx in range(CHAIN_RANKS + 1):
+        if idx < min(CHAIN_RANKS, len(present)) and present[idx]:
+            continue
+        if idx - start >= min_length:
+            runs += 1
+            covered.update(range(start, idx))
+        start = idx + 1
+    return runs, covered
+
+
+@lru_cache(maxsize=2 ** 16)
+def hand_features(counts: tuple) -> dict:
+    """
+    extract bidding features of a hand, cached since the same hands come up again in sweeps
+    :param counts: a tuple of the 15 counts of to_counts
+    :return: a dict of feature counts
+    >>> hand_features(tuple(to_counts([3, 4, 5, 6, 7, 9, 9, 9, 10, 10, 10, 12, 14, 16, 16, 16, 16, 20, 30])))
+    {'bombs': 1, 'rockets': 1, 'chains': 1, 'planes': 1, 'high_cards': 7, 'singletons': 1}
+    """
+    chains, chain_covered = count_runs([c >= 1 for c in counts], MIN_SERIAL_SINGLE)
+    planes, _ = count_runs([c >= 3 for c in counts], MIN_SERIAL_TRIPLE)
+    return {
+        'bombs': sum(c == 4 for c in counts),
+        'rockets': int(counts[rank2idx[20]] == 1 and counts[rank2idx[30]] == 1),
+        'chains': chains,
+        'planes': planes,
+        'high_cards': sum(counts[HIGH_CARD_START:]),
+        'singletons': sum(counts[idx] == 1 and idx not in chain_covered for idx in range(HIGH_CARD_START))
+    }
+
+
+def feature_score(features: dict) -> int:
+    """
+    weighted sum of the features, used as the bidding strength of a hand
+    >>> feature_score({'bombs': 1, 'rockets': 0, 'chains': 1, 'planes': 0, 'high_cards': 3, 'singletons': 2})
+    20
+    """
+    return sum(FEATURE_WEIGHTS[k] * v for k, v in features.items())
+
+
+def bid_weights(hands: list, bidding=BID_HAND_POINTS) -> list:
+    """
+    weights of each player to become the landlord
+    :param hands: a list of card lists
+    :param bidding: BID_HAND_POINTS or BID_HAND_FEATURES
+    :return: a list of weights for random.choices
+    >>> bid_weights([[3, 4], [5]])
+    [49, 25]
+    >>> bid_weights([[3, 3, 3, 3], [5], [16, 20, 30]], BID_HAND_FEATURES)
+    [100, 1, 484]
+    """
+    if bidding == BID_HAND_FEATURES:
+        return [max(feature_score(hand_features(tuple(to_counts(hand)))), 1) ** 2 for hand in hands]
+    return [sum(hand) ** 2 for hand in hands]
+
+
+def _batch_runs(present, min_length):
+    """vectorized count_runs over the last axis, returns (runs, covered mask)"""
+    import numpy as np
+    forward = np.zeros(present.shape, dtype=np.int64)  # length of the run ending at each rank
+    backward = np.zeros(present.shape, dtype=np.int64)  # length of the run starting at each rank
+    run = np.zeros(present.shape[:-1], dtype=np.int64)
+    for idx in range(CHAIN_RANKS):
+        run = np.where(present[..., idx], run + 1, 0)
+        forward[..., idx] = run
+    run = np.zeros(present.shape[:-1], dtype=np.int64)
+    for idx in reversed(range(CHAIN_RANKS)):
+        run = np.where(present[..., idx], run + 1, 0)
+        backward[..., idx] = run
+    runs = (forward == min_length).sum(axis=-1)  # a long enough run reaches min_length exactly once
+    covered = present & (forward + backward - 1 >= min_length)
+    return runs, covered
+
+
+def hand_features_batch(counts) -> dict:
+    """
+    vectorized hand_features for many hands at once, e.g. all three hands of millions of deals
+    :param counts: an int array with the last axis of 15 counts, e.g. shape (deals, 3, 15)
+    :return: a dict of feature arrays with the shape of counts without the last axis
+    >>> import numpy as np
+    >>> hands = [[3, 4, 5, 6, 7, 9, 9, 9, 10, 10, 10, 12, 14, 16, 16, 16, 16, 20, 30], [3, 3, 3, 3, 5, 20]]
+    >>> batch = hand_features_batch(np.array([to_counts(h) for h in hands]))
+    >>> [{k: int(v[i]) for k, v in batch.items()} == hand_features(tuple(to_counts(h))) for i, h in enumerate(hands)]
+    [True, True]
+    """
+    import numpy as np
+    counts = np.asarray(counts)
+    chains, chain_covered = _batch_runs(counts[..., :CHAIN_RANKS] >= 1, MIN_SERIAL_SINGLE)
+    planes, _ = _batch_runs(counts[..., :CHAIN_RANKS] >= 3, MIN_SERIAL_TRIPLE)
+    low = counts[..., :HIGH_CARD_START]
+    return {
+        'bombs': (counts == 4).sum(axis=-1),
+        'rockets': ((counts[..., rank2idx[20]] == 1) & (counts[..., rank2idx[30]] == 1)).astype(np.int64),
+        'chains': chains,
+        'planes': planes,
+        'high_cards': counts[..., HIGH_CARD_START:].sum(axis=-1),
+        'singletons': ((low == 1) & ~chain_covered[..., :HIGH_CARD_START]).sum(axis=-1)
+    }
+
+
+def feature_score_batch(counts):
+    """
+    vectorized feature_score(hand_features(...)) for a count array
+    >>> import numpy as np
+    >>> feature_score_batch(np.array([to_counts([3, 3, 3, 3, 5]), to_counts([16, 20, 30])])).tolist()
+    [9, 22]
+    """
+    return sum(FEATURE_WEIGHTS[k] * v for k, v in hand_features_batch(counts).items())
+
+
+def random_deal_counts(deals: int, seed=None):
+    """
+    deal shuffled decks and count them, much faster than dealing Deck objects one by one
+    :param deals: number of deals
+    :param seed: seed for numpy's random generator
+    :return: an int array of shape (deals, 4, 15), three hands of 17 cards and the 3 cards left
+    >>> c = random_deal_counts(5, seed=1)
+    >>> c.shape, c.sum(axis=(1, 2)).tolist(), c[:, :3].sum(axis=2).tolist()[0]
+    ((5, 4, 15), [54, 54, 54, 54, 54], [17, 17, 17])
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ranks = len(RANK_ORDER)
+    deck = np.repeat(np.arange(ranks, dtype=np.int8), [DECK_DICT[int2rank[rank]] for rank in RANK_ORDER])
+    shuffled = rng.permuted(np.tile(deck, (deals, 1)), axis=1)
+    owner = np.repeat(np.arange(4), [17, 17, 17, 3])
+    # one flat bin per (deal, owner, rank)
+    bins = (np.arange(deals)[:, None] * 4 + owner[None, :]) * ranks + shuffled
+    return np.bincount(bins.ravel(), minlength=deals * 4 * ranks).reshape(deals, 4, ranks).astype(np.int8)
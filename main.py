@@ -2,8 +2,46 @@
 
 from game_functions import *
 from game_moves import *
+from game_stats import GameStatsCollector, write_sidecar
+from result_cache import ResultCache
 from time import process_time
 import csv
+import random
+
+
+def simulate_cell(rule, games, landlord_lv, peasants_lv, print_details=False, bidding=BID_HAND_POINTS,
+                  landlord_policy=None, peasants_policy=None, batch_size=1, stats=False, exporter=None) -> dict:
+    """
+    Plays the games of one (rule, landlord level, peasants level) cell
+    :param stats: Collects game statistics (see game_stats.py) when true
+    :param exporter: A ShardWriter (see dataset_export.py) that gets every decision of the games
+    :return: a dict of the win counts, and the state of the GameStatsCollector as 'stats' when collected
+    """
+    wins_landlord = 0
+    wins_peasants = 0
+    collector = GameStatsCollector() if stats else None
+    for start in range(0, games, batch_size):
+        player_lists = [[Player() for _ in range(3)] for _ in range(min(batch_size, games - start))]
+        for player_list in player_lists:
+            set_up_new_game(player_list, landlord_lv=landlord_lv, peasants_lv=peasants_lv, bidding=bidding,
+                            landlord_policy=landlord_policy, peasants_policy=peasants_policy)
+        records = [] if stats else None
+        for winner in play_games(player_lists, rule, print_details=print_details, records=records,
+                                 exporter=exporter):
+            if winner == LANDLORD:
+                if print_details:
+                    print("Landlord Won\n")
+                wins_landlord += 1
+            elif winner == PEASANT:
+                wins_peasants += 1
+                if print_details:
+                    print("Peasants Won\n")
+        for record in records or []:
+            collector.update(record)
+    cell_result = {'wins_landlord': wins_landlord, 'wins_peasants': wins_peasants}
+    if stats:
+        cell_result['stats'] = collector.to_state()
+    return cell_result
 
 
 def execute_simulation(
@@ -13,7 +51,16 @@ def execute_simulation(
         peasants_lv=0,
         single_sim=True,
         print_details=False,
-        write_file=False
+        write_file=False,
+        bidding=BID_HAND_POINTS,
+        landlord_policy=None,
+        peasants_policy=None,
+        batch_size=1,
+        seed=None,
+        cache=None,
+        sampler=None,
+        stats=False,
+        exporter=None
 ) -> None:
     """
     The function for executing the whole simulation, takes a few variables from the caller for customization.
@@ -24,47 +71,74 @@ def execute_simulation(
     :param single_sim: Does the simulation run once or multiple times
     :param print_details: Prints details of each game when true
     :param write_file: Writes into csv when true
+    :param bidding: How the landlord is picked, BID_HAND_POINTS or BID_HAND_FEATURES
+    :param landlord_policy: A Policy object for the landlord, None plays the QuantilePolicy of the landlord level
+    :param peasants_policy: A Policy object for the peasants, None plays the QuantilePolicy of the peasants level
+    :param batch_size: How many games are played in lockstep, policies get their decisions in batches of this size
+    :param seed: Seeds every cell with (seed, rule, levels) so that cells are reproducible, None does not seed
+    :param cache: A ResultCache object (see result_cache.py), cells already in it are not simulated again.
+                  Not used with custom policies since they are not part of the cache key, nor without a seed
+    :param sampler: A StratifiedSampler object (see sampling.py), cells play stratified games by landlord hand points
+                    and report the stratified win rate with its standard error, None deals plain random games.
+                    Its bidding must be the same as bidding
+    :param stats: Collects rounds, turns, bombs, rockets, cards left and landlord hand points of every game online.
+                  Their means and variances are added as csv columns, the histograms go to a _stats.json sidecar file
+    :param exporter: A ShardWriter (see dataset_export.py) that streams every decision into .npy shards as training data,
+                     closed at the end. Cached cells are not played, so the cache is not used while exporting
     """
+    if sampler is not None and sampler.bidding != bidding:
+        # the strata and their weights were estimated from deals of the sampler's bidding
+        raise ValueError(f'the sampler deals with {bidding_int2str[sampler.bidding]} bidding, '
+                         f'not {bidding_int2str[bidding]}')
     rules = rules
+    reset_forced_pass_stats()  # the counters are global, report the games of this call only
     if single_sim:
         landlord_lvs = range(landlord_lv, landlord_lv+1)
         peasants_lvs = range(peasants_lv, peasants_lv+1)
     else:
         landlord_lvs = range(10)
         peasants_lvs = range(10)
+    # unseeded cells are a new random sample every run, so only seeded cells are cached
+    use_cache = (cache is not None and seed is not None and landlord_policy is None and peasants_policy is None
+                 and exporter is None)
+    if use_cache:
+        cache.refresh_source()
 
     for rule in rules:
         game_results = []  # Saves all results in a list
+        stats_cells = []  # Full statistics of each cell for the sidecar file
         for i in landlord_lvs:
             for j in peasants_lvs:
                 games = games
-                wins_landlord = 0
-                wins_peasants = 0
 
                 start_time = process_time()
 
-                for _ in range(games):
-                    player_list = [Player() for _ in range(3)]
-                    set_up_new_game(player_list, landlord_lv=i, peasants_lv=j)
-                    if rule == SPECIAL_RULE3:
-                        play_a_round(player_list, rule, print_details=print_details, is_rule3_1st_round=True)
-                    while True:
-                        round_result = play_a_round(player_list, rule, print_details=print_details)
-                        if round_result == LANDLORD:
-                            if print_details:
-                                print("Landlord Won\n")
-                            wins_landlord += 1
-                            break
-                        elif round_result == PEASANT:
-                            wins_peasants += 1
-                            if print_details:
-                                print("Peasants Won\n")
-                            break
-                        elif round_result == GAME_CONTINUE:
-                            continue
-
-                landlord_win_rate = wins_landlord / games
-                peasants_win_rate = wins_peasants / games
+                cell_key = cache.key(rule=rule, landlord_lv=i, peasants_lv=j, games=games, seed=seed,
+                                      bidding=bidding, sampler=sampler and sampler.key(),
+                                      stats=stats) if use_cache else None
+                cell_result = cache.get(cell_key) if use_cache else None
+                cached = cell_result is not None
+                if not cached:
+                    if seed is not None:
+                        random.seed(f'{seed}-{rule}-{i}-{j}')
+                    if sampler is not None:
+                        cell_result = sampler.simulate_cell(rule, games, i, j, print_details=print_details,
+                                                            landlord_policy=landlord_policy,
+                                                            peasants_policy=peasants_policy, batch_size=batch_size,
+                                                            stats=stats, exporter=exporter)
+                    else:
+                        cell_result = simulate_cell(rule, games, i, j, print_details=print_details, bidding=bidding,
+                                                    landlord_policy=landlord_policy, peasants_policy=peasants_policy,
+                                                    batch_size=batch_size, stats=stats, exporter=exporter)
+                    if use_cache:
+                        cache.put(cell_key, cell_result)
+
+                if sampler is not None:
+                    landlord_win_rate = cell_result['win_rate_landlord']
+                    peasants_win_rate = 1 - landlord_win_rate
+                else:
+                    landlord_win_rate = cell_result['wins_landlord'] / games
+                    peasants_win_rate = cell_result['wins_peasants'] / games
 
                 rule_str = 'special' if rule else 'original'
                 print(f'\nAmong {games} {rule_str} games played, the win rates are:\n\t'
@@ -73,17 +147,31 @@ def execute_simulation(
 
                 elapsed_time = process_time() - start_time
 
-                print('Runtime:', elapsed_time, 'seconds')
+                if sampler is not None:
+                    print(f'\tStratified standard error: {cell_result["std_err_landlord"]:.2%}')
+                print('Runtime:', elapsed_time, 'seconds', '(cached)' if cached else '')
 
                 games_result = {'games_played': games,
                                 'landlord_lv': i,
                                 'peasants_lv': j,
                                 'win_rate_landlord': landlord_win_rate,
                                 'win_rate_peasants': peasants_win_rate}
+                if sampler is not None:
+                    games_result['std_err_landlord'] = cell_result['std_err_landlord']
+                if stats:
+                    games_result.update(GameStatsCollector.from_state(cell_result['stats']).columns())
+                    stats_cells.append({'landlord_lv': i, 'peasants_lv': j, 'stats': cell_result['stats']})
                 game_results.append(games_result)
 
         if write_file:
-            filename = "DouDiZhu_results_" + rules_int2str[rule] + ".csv"
+            filename = "DouDiZhu_results_" + rules_int2str[rule]
+            if bidding != BID_HAND_POINTS:
+                filename += "_" + bidding_int2str[bidding]
+            if sampler is not None:
+                filename += "_STRATIFIED"
+            if stats:
+                write_sidecar(filename + "_stats.json", stats_cells)
+            filename += ".csv"
             with open(filename, "w", encoding="utf-8", newline='') as ddz_csv:
                 fieldnames = game_results[0].keys()
                 writer = csv.DictWriter(ddz_csv, fieldnames=fieldnames)
@@ -92,6 +180,15 @@ def execute_simulation(
                 for games_result in game_results:
                     writer.writerow(games_result)
 
+    if exporter is not None:
+        exporter.close()
+        print(f'Exported {exporter.games} games to {len(exporter.shards)} shards in {exporter.directory}')
+    if use_cache:
+        print(f'Cache: {cache.hits} hits, {cache.misses} misses')
+    if forced_pass_stats['checks']:
+        print(f'Forced passes: {forced_pass_stats["forced_passes"]} of {forced_pass_stats["checks"]} '
+              f'decisions against a rival move ({forced_pass_rate():.2%}) skipped move generation')
+
 
 if __name__ == '__main__':
     t0 = process_time()
@@ -99,6 +196,9 @@ if __name__ == '__main__':
     games_per_simulation = 1234
     level_of_landlord = 2
     level_of_peasants = 4
+    bidding_mode = BID_HAND_POINTS
+    random_seed = 597
+    result_cache = ResultCache()
 
     execute_simulation(rules=rules_list[:],
                        games=games_per_simulation,
@@ -106,7 +206,10 @@ if __name__ == '__main__':
                        peasants_lv=level_of_peasants,
                        single_sim=False,
                        print_details=False,
-                       write_file=True)
+                       write_file=True,
+                       bidding=bidding_mode,
+                       seed=random_seed,
+                       cache=result_cache)
 
     t = process_time() - t0
     print('Total runtime:', t, 'seconds')
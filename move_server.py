@@ -0,0 +1,204 @@
+"""
+A long-running move suggestion server that keeps the engine and its caches warm.
+It listens on stdio or a local Unix socket, one request per line:
+    <id> <hand> <rival move> <rule> <strength>
+cards are written as ranks, e.g. 33456TJQKA2XD, and - is an empty move (the player leads). The reply is:
+    <id> <chosen move> <legal move>,<legal move>,...
+where - as the legal moves means the player can only pass.
+Requests can be pipelined: every complete line of a read is handled as one batch and the replies are sent together.
+The line "stats" replies with the request count and the p50/p99 latency.
+A bad request (unknown rule, strength outside 0-9, impossible cards, ...) gets <id> ERR <reason> and the others go on.
+"""
+
+from game_functions import *
+from collections import Counter, deque
+from functools import lru_cache
+from time import perf_counter
+import os
+import socketserver
+import sys
+
+
+def parse_cards(text: str) -> list:
+    """
+    >>> parse_cards('33TX'), parse_cards('-')
+    ([3, 3, 10, 20], [])
+    """
+    if text == '-':
+        return []
+    return sorted(rank2int[rank] for rank in text)
+
+
+def format_cards(cards) -> str:
+    """
+    >>> format_cards([3, 3, 10, 20]), format_cards([])
+    ('33TX', '-')
+    """
+    return ''.join(int2rank[card] for card in cards) or '-'
+
+
+def request_error(hand: list, rival_move: list, rule: int, strength: int):
+    """
+    checks the values of a parsed request
+    :return: the error message, None for a valid request
+    >>> request_error([3, 4], [5], 0, 9), request_error([3, 4], [5], 0, 10), request_error([3, 4], [5], 9, 0)
+    (None, 'strength must be 0 to 9', 'unknown rule 9')
+    >>> request_error([3, 3, 3, 3, 3], [], 0, 0), request_error([3, 3, 3], [3, 3], 0, 0)
+    ('more copies of a card than the deck has', 'more copies of a card than the deck has')
+    """
+    if rule not in rules_int2str:
+        return f'unknown rule {rule}'
+    if not 0 <= strength <= 9:
+        return 'strength must be 0 to 9'
+    if not 1 <= len(hand) <= 20:
+        return 'a hand has 1 to 20 cards'
+    if any(count > DECK_DICT[int2rank[card]] for card, count in Counter(hand + rival_move).items()):
+        return 'more copies of a card than the deck has'
+    return None
+
+
+def decode_line(line: bytes):
+    """
+    >>> decode_line(b' 1 3 - 0 0 '), decode_line(b'\\xff')
+    ('1 3 - 0 0', None)
+    """
+    try:
+        return line.decode().strip()
+    except UnicodeDecodeError:
+        return None
+
+
+@lru_cache(maxsize=2 ** 16)
+def legal_moves(hand: tuple, rival_move: tuple, rule: int) -> tuple:
+    """
+    cached legal moves of a hand against a rival move
+    >>> legal_moves((5, 6, 6), (5, 5), 0)
+    ([6, 6],)
+    """
+    move_generator = MoveGeneration(list(hand), list(rival_move), rule)
+    move_generator.generate_move()
+    return tuple(move_generator.new_move)
+
+
+class MoveServer:
+    """Handles batches of request lines and keeps latency statistics"""
+
+    def __init__(self, latency_window=10000):
+        self.requests = 0
+        self.latencies = deque(maxlen=latency_window)  # seconds, of the latest requests
+
+    def handle_lines(self, lines: list, received=None) -> list:
+        """
+        :param lines: request lines without newlines, None for a line that is not utf-8
+        :param received: perf_counter() when the lines arrived
+        :return: reply lines, one per request line
+        >>> server = MoveServer()
+        >>> server.handle_lines(['1 55566 44 0 0', '2 3 2 0 0', '3 x'])
+        ['1 55 55,66', '2 - -', '3 ERR expected <id> <hand> <rival move> <rule> <strength>']
+        >>> server.handle_lines(['4 3456 - 0 10', '5 33333 - 0 0', None, '6 3 - 0 9'])
+        ['4 ERR strength must be 0 to 9', '5 ERR more copies of a card than the deck has', '- ERR not utf-8', '6 3 3']
+        """
+        received = perf_counter() if received is None else received
+        replies = [''] * len(lines)
+        batches = {}  # strength: [(line index, request id, Decision)]
+        stats_lines = []  # answered after the batch, so they include it
+        for n, line in enumerate(lines):
+            if line is None:
+                replies[n] = '- ERR not utf-8'
+                continue
+            fields = line.split()
+            if fields == ['stats']:
+                stats_lines.append(n)
+                continue
+            try:
+                request_id, hand, rival_move, rule, strength = fields
+                hand, rival_move, rule, strength = parse_cards(hand), parse_cards(rival_move), int(rule), int(strength)
+            except (ValueError, KeyError):
+                replies[n] = f'{fields[0] if fields else "-"} ERR expected <id> <hand> <rival move> <rule> <strength>'
+                continue
+            error = request_error(hand, rival_move, rule, strength)
+            if error:
+                replies[n] = f'{request_id} ERR {error}'
+                continue
+            try:
+                moves = [list(move) for move in legal_moves(tuple(hand), tuple(rival_move), rule)]
+            except (KeyError, TypeError, IndexError):
+                replies[n] = f'{request_id} ERR illegal rival move'
+                continue
+            decision = Decision(moves, hand, rival_move, [rival_move] if rival_move else [], rule=rule)
+            batches.setdefault(strength, []).append((n, request_id, decision))
+
+        for strength, requests in batches.items():
+            chosen = quantile_policy(strength).choose([decision for _, _, decision in requests])
+            for (n, request_id, decision), move in zip(requests, chosen):
+                legal = ','.join(format_cards(m) for m in decision.moves) or '-'
+                replies[n] = f'{request_id} {format_cards(move)} {legal}'
+                self.requests += 1
+
+        latency = perf_counter() - received
+        self.latencies.extend([latency] * sum(len(requests) for requests in batches.values()))
+        for n in stats_lines:
+            replies[n] = self.stats()
+        return replies
+
+    def stats(self) -> str:
+        """
+        >>> MoveServer().stats()
+        'stats requests=0 p50_ms=0.000 p99_ms=0.000'
+        """
+        latencies = sorted(self.latencies)
+        p50 = latencies[int(0.50 * (len(latencies) - 1))] if latencies else 0
+        p99 = latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0
+        return f'stats requests={self.requests} p50_ms={p50 * 1000:.3f} p99_ms={p99 * 1000:.3f}'
+
+    def serve_stream(self, read_chunk, write) -> None:
+        """
+        serves one stream until it is closed
+        :param read_chunk: a function that returns the next bytes, b'' at the end
+        :param write: a function that writes bytes
+        """
+        pending = b''
+        while True:
+            chunk = read_chunk()
+            if not chunk:
+                break
+            received = perf_counter()
+            pending += chunk
+            *lines, pending = pending.split(b'\n')
+            lines = [decode_line(line) for line in lines if line.strip()]
+            if lines:
+                write(('\n'.join(self.handle_lines(lines, received)) + '\n').encode())
+
+    def serve_stdio(self) -> None:
+        stdout = sys.stdout.buffer
+
+        def write(data):
+            stdout.write(data)
+            stdout.flush()
+
+        self.serve_stream(lambda: os.read(sys.stdin.fileno(), 1 << 16), write)
+
+    def serve_unix(self, path: str) -> None:
+        """serves every connection of a Unix socket in its own thread, sharing the caches and statistics"""
+        move_server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                move_server.serve_stream(lambda: self.request.recv(1 << 16), self.request.sendall)
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+            server.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve legal and chosen moves over stdio or a Unix socket')
+    parser.add_argument('--socket', help='path of the Unix socket, serves stdio when not given')
+    args = parser.parse_args()
+
+    if args.socket:
+        MoveServer().serve_unix(args.socket)
+    else:
+        MoveServer().serve_stdio()
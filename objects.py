@@ -81,6 +81,7 @@ class Player:
         self.hand_points = 0
         self.first_player_next_round = False
         self.strength = 0  # 0-9, the higher the character will play stronger moves
+        self.policy = None  # a Policy object (see policies.py), None plays the QuantilePolicy of strength
 
     def update_hand_points(self):
         """
@@ -0,0 +1,59 @@
+"""This module contains player policies, which pick a move from the legal moves"""
+
+from constants import *
+
+
+class Decision:
+    """A pending decision of a player, handed to a policy together with other decisions"""
+
+    def __init__(self, moves: list, hand: list, rival_move: list, move_list: list, character=-1, rule=0):
+        self.moves = moves  # legal moves, an empty list means the player can only pass
+        self.hand = hand
+        self.rival_move = rival_move
+        self.move_list = move_list  # moves played in the round so far
+        self.character = character
+        self.rule = rule
+
+
+class Policy:
+    """
+    Base class of policies, a policy gets a batch of decisions and returns one move per decision.
+    Policies that are expensive to set up (lookup tables, evaluators, search) can share the work across the batch.
+    """
+
+    def choose(self, decisions: list) -> list:
+        """
+        :param decisions: a list of Decision objects
+        :return: a list of moves, one for each decision, [] means pass
+        """
+        raise NotImplementedError
+
+
+class QuantilePolicy(Policy):
+    """Plays the move at the strength/10 quantile of the legal moves, the original way of playing"""
+
+    def __init__(self, strength=0):
+        self.strength = strength  # 0-9, the higher the policy will play stronger moves
+
+    def choose(self, decisions: list) -> list:
+        """
+        >>> d = [Decision([[4], [5], [6]], [4, 5, 6], [3], [[3]]), Decision([], [3], [16], [[16]])]
+        >>> QuantilePolicy(5).choose(d)
+        [[5], []]
+        """
+        return [d.moves[int(self.strength / 10 * len(d.moves))] if len(d.moves) else [] for d in decisions]
+
+
+class RandomPolicy(Policy):
+    """Plays a uniformly random legal move"""
+
+    def __init__(self, seed=None):
+        import random
+        self.rng = random.Random(seed)
+
+    def choose(self, decisions: list) -> list:
+        """
+        >>> RandomPolicy(seed=1).choose([Decision([[4]], [4], [3], [[3]]), Decision([], [3], [16], [[16]])])
+        [[4], []]
+        """
+        return [self.rng.choice(d.moves) if len(d.moves) else [] for d in decisions]
@@ -0,0 +1,162 @@
+"""This module stores simulation results on disk, keyed by a hash of everything that decides the result"""
+
+import argparse
+import hashlib
+import json
+import os
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(MODULE_DIR, '.ddz_cache')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Modules that decide the result of a game, a change in any of them invalidates the cache.
+# main.py holds simulate_cell and the seeding of each cell
+SOURCE_FILES = ('main.py', 'game_moves.py', 'game_functions.py', 'objects.py', 'constants.py', 'policies.py',
+                'hand_features.py', 'game_stats.py', 'sampling.py')
+
+
+def source_fingerprint(files=SOURCE_FILES) -> str:
+    """
+    :return: sha256 of the game modules, files that do not exist are skipped.
+             It is not cached, so modules edited and reloaded in a notebook are seen by the next simulation
+    """
+    digest = hashlib.sha256()
+    for filename in files:
+        path = os.path.join(MODULE_DIR, filename)
+        if os.path.exists(path):
+            digest.update(filename.encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A content-addressed cache of simulation results, one json file per cell.
+    The least recently used entries are evicted when the cache is larger than max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.source = source_fingerprint()
+
+    def refresh_source(self) -> None:
+        """hashes the game modules again, once per simulation run"""
+        self.source = source_fingerprint()
+
+    def key(self, **cell) -> str:
+        """
+        hash of a cell, e.g. rule, landlord_lv, peasants_lv, games and seed, with the source fingerprint
+        >>> cache = ResultCache()
+        >>> cache.key(rule=0, games=10) == cache.key(games=10, rule=0)
+        True
+        >>> cache.key(rule=0, games=10) == cache.key(rule=1, games=10)
+        False
+        """
+        cell['source'] = self.source
+        return hashlib.sha256(json.dumps(cell, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key: str):
+        """
+        :return: the cached result, None if missing
+        """
+        path = self.path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        """writes a result atomically, then evicts old entries if needed"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self) -> list:
+        """
+        :return: a list of (mtime, size, path) of all entries, oldest first
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith('.json'):
+                    stat = os.stat(os.path.join(root, filename))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename)))
+        return sorted(entries)
+
+    def evict(self) -> int:
+        """
+        removes the least recently used entries until the cache fits max_bytes
+        :return: number of entries removed
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """removes all entries, returns the number removed"""
+        entries = self.entries()
+        for _, _, path in entries:
+            os.remove(path)
+        return len(entries)
+
+    def report(self) -> dict:
+        """
+        >>> import tempfile
+        >>> cache = ResultCache(tempfile.mkdtemp(), max_bytes=1000)
+        >>> cache.put(cache.key(rule=0), {'win_rate_landlord': 0.5})
+        >>> cache.get(cache.key(rule=0)), cache.get(cache.key(rule=1))
+        ({'win_rate_landlord': 0.5}, None)
+        >>> r = cache.report()
+        >>> r['entries'], r['hits'], r['misses']
+        (1, 1, 1)
+        """
+        entries = self.entries()
+        return {'directory': self.directory,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'source_fingerprint': self.source[:12]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report or clear the simulation result cache')
+    parser.add_argument('command', choices=['report', 'clear', 'evict'])
+    parser.add_argument('--dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES)
+    args = parser.parse_args()
+
+    result_cache = ResultCache(args.dir, args.max_bytes)
+    if args.command == 'report':
+        for k, v in result_cache.report().items():
+            if k not in ('hits', 'misses'):
+                print(f'{k}: {v}')
+    elif args.command == 'clear':
+        print(f'Removed {result_cache.clear()} entries')
+    else:
+        print(f'Evicted {result_cache.evict()} entries')
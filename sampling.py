@@ -0,0 +1,158 @@
+"""This module contains stratified sampling of deals by the strength of the landlord's hand"""
+
+from game_functions import *
+from game_stats import GameStatsCollector
+from bisect import bisect_right
+from math import sqrt
+
+
+def landlord_points(players: list[Player()]) -> int:
+    """
+    sum of the landlord's 20 cards after set_up_new_game, the hand strength used for the strata
+    """
+    for player in players:
+        if player.character == LANDLORD:
+            return player.hand.get_deck_points()
+    return 0
+
+
+def allocate(games: int, weights: list, min_games=2) -> list:
+    """
+    proportional allocation of games to strata, with the largest remainders rounded up
+    :param games: total games
+    :param weights: population weight of each stratum
+    :param min_games: every stratum gets at least this many games, so its variance can be estimated,
+                      lowered when there are not enough games for it
+    :return: the games of each stratum, they always add up to games
+    >>> allocate(100, [0.5, 0.3, 0.2])
+    [50, 30, 20]
+    >>> allocate(10, [0.55, 0.3, 0.15])
+    [5, 3, 2]
+    >>> allocate(20, [0.9, 0.05, 0.05])
+    [16, 2, 2]
+    >>> allocate(5, [0.2] * 5), allocate(7, [0.2] * 5)
+    ([1, 1, 1, 1, 1], [2, 2, 1, 1, 1])
+    >>> sum(allocate(1234, [0.2] * 5))
+    1234
+    """
+    min_games = min(min_games, games // len(weights))
+    counts = [max(int(games * w), min_games) for w in weights]
+    remainders = sorted(range(len(weights)), key=lambda h: games * weights[h] - int(games * weights[h]), reverse=True)
+    for h in remainders:
+        if sum(counts) >= games:
+            break
+        counts[h] += 1
+    while sum(counts) > games:
+        # the minimums took games from the others, take them back from the most overallocated stratum
+        h = max((h for h in range(len(weights)) if counts[h] > min_games), key=lambda h: counts[h] - games * weights[h])
+        counts[h] -= 1
+    return counts
+
+
+def stratified_estimate(wins: list, games: list, weights: list) -> tuple:
+    """
+    unbiased win rate of the population from per-stratum results, with its standard error
+    :param wins: landlord wins in each stratum
+    :param games: games played in each stratum
+    :param weights: population weight of each stratum
+    :return: (win rate, standard error)
+    >>> rate, std_err = stratified_estimate([10, 40], [50, 50], [0.5, 0.5])
+    >>> rate, round(std_err, 4)
+    (0.5, 0.0404)
+    """
+    rate = 0.0
+    variance = 0.0
+    for w, n, g in zip(wins, games, weights):
+        if not n:
+            continue
+        p = w / n
+        rate += g * p
+        variance += g ** 2 * p * (1 - p) / max(n - 1, 1)
+    return rate, sqrt(variance)
+
+
+class StratifiedSampler:
+    """
+    Splits deals into strata of landlord hand points with equal population weights, estimated from a pilot of deals.
+    Each cell then plays a proportional number of games in every stratum and combines them by the weights,
+    which removes the between-strata part of the variance of the win rate.
+    """
+
+    def __init__(self, strata=5, pilot_deals=20000, seed=None, bidding=BID_HAND_POINTS):
+        """
+        :param strata: number of hand point strata
+        :param pilot_deals: how many deals (without playing) estimate the strata and their weights
+        :param seed: seed of the pilot deals
+        :param bidding: the bidding of the deals, BID_HAND_POINTS or BID_HAND_FEATURES
+        """
+        self.bidding = bidding
+        state = random.getstate()
+        if seed is not None:
+            random.seed(seed)
+        points = []
+        for _ in range(pilot_deals):
+            players = [Player() for _ in range(3)]
+            set_up_new_game(players, bidding=bidding)
+            points.append(landlord_points(players))
+        random.setstate(state)
+
+        points.sort()
+        edges = sorted(set(points[len(points) * h // strata] for h in range(1, strata)))
+        self.edges = edges  # stratum h holds points in [edges[h-1], edges[h])
+        counts = [0] * (len(edges) + 1)
+        for p in points:
+            counts[self.stratum(p)] += 1
+        self.weights = [c / len(points) for c in counts]
+
+    def stratum(self, points: int) -> int:
+        return bisect_right(self.edges, points)
+
+    def key(self) -> dict:
+        """the settings that decide the results, used in the cache key"""
+        return {'edges': self.edges, 'weights': [round(w, 6) for w in self.weights], 'bidding': self.bidding}
+
+    def set_up_in_stratum(self, players: list[Player()], stratum: int, landlord_lv=0, peasants_lv=0,
+                          landlord_policy=None, peasants_policy=None) -> None:
+        """
+        deals new games until the landlord's hand points fall in the stratum
+        :param players: a list of 3 new player objects, replaced in place
+        """
+        while True:
+            set_up_new_game(players, landlord_lv=landlord_lv, peasants_lv=peasants_lv, bidding=self.bidding,
+                            landlord_policy=landlord_policy, peasants_policy=peasants_policy)
+            if self.stratum(landlord_points(players)) == stratum:
+                return
+            players[:] = [Player() for _ in range(3)]
+
+    def simulate_cell(self, rule, games, landlord_lv, peasants_lv, print_details=False,
+                      landlord_policy=None, peasants_policy=None, batch_size=1, stats=False, exporter=None) -> dict:
+        """
+        plays a stratified cell
+        :param stats: collects game statistics (see game_stats.py) when true
+        :param exporter: a ShardWriter (see dataset_export.py) that gets every decision of the games
+        :return: a dict of the win counts, the stratified landlord win rate and its standard error,
+                 and the state of the GameStatsCollector as 'stats' when collected
+        """
+        allocation = allocate(games, self.weights)
+        wins = []
+        collector = GameStatsCollector() if stats else None
+        for stratum, stratum_games in enumerate(allocation):
+            stratum_wins = 0
+            for start in range(0, stratum_games, batch_size):
+                player_lists = [[Player() for _ in range(3)] for _ in range(min(batch_size, stratum_games - start))]
+                for player_list in player_lists:
+                    self.set_up_in_stratum(player_list, stratum, landlord_lv, peasants_lv,
+                                           landlord_policy, peasants_policy)
+                records = [] if stats else None
+                stratum_wins += play_games(player_lists, rule, print_details=print_details,
+                                           records=records, exporter=exporter).count(LANDLORD)
+                for record in records or []:
+                    collector.update(record)
+            wins.append(stratum_wins)
+
+        rate, std_err = stratified_estimate(wins, allocation, self.weights)
+        cell_result = {'wins_landlord': sum(wins), 'wins_peasants': sum(allocation) - sum(wins),
+                       'win_rate_landlord': rate, 'std_err_landlord': std_err}
+        if stats:
+            cell_result['stats'] = collector.to_state()
+        return cell_result
@@ -0,0 +1,177 @@
+"""This module runs tournaments between player policies with Elo ratings and racing-based early elimination"""
+
+from game_functions import *
+from math import log, sqrt
+from time import process_time
+import csv
+
+
+class Tournament:
+    """
+    Candidates play each other as the landlord and as the peasants in rounds.
+    After every round, candidates whose score is statistically dominated by the best candidate are dropped (racing),
+    so later rounds only spend games on the close contests.
+    """
+
+    def __init__(self, candidates: dict, rule=ORIGINAL_RULE, bidding=BID_HAND_POINTS, k_factor=16, delta=0.05):
+        """
+        :param candidates: a dict of name: Policy object
+        :param rule: the rule of the games
+        :param bidding: how the landlord is picked, BID_HAND_POINTS or BID_HAND_FEATURES
+        :param k_factor: the Elo K factor
+        :param delta: the chance of dropping a candidate by mistake over the whole run, used in the Hoeffding bounds
+        """
+        self.candidates = candidates
+        self.rule = rule
+        self.bidding = bidding
+        self.k_factor = k_factor
+        self.delta = delta
+        self.ratings = {name: 1500.0 for name in candidates}
+        self.landlord_advantage = 0.0  # Elo points the landlord seat is worth, learned with the ratings
+        self.games = {name: 0 for name in candidates}
+        self.scores = {name: 0.0 for name in candidates}  # games won, as the landlord or as the peasants
+        self.alive = list(candidates)
+        self.eliminated = {}  # name: the round it was dropped
+
+    def expected_landlord_score(self, landlord: str, peasants: str) -> float:
+        """
+        >>> t = Tournament({'a': None, 'b': None})
+        >>> t.expected_landlord_score('a', 'b')
+        0.5
+        """
+        diff = self.ratings[landlord] + self.landlord_advantage - self.ratings[peasants]
+        return 1 / (1 + 10 ** (-diff / 400))
+
+    def update_ratings(self, landlord: str, peasants: str, landlord_won: bool) -> None:
+        """
+        incremental Elo update after one game
+        >>> t = Tournament({'a': None, 'b': None})
+        >>> t.update_ratings('a', 'b', True)
+        >>> t.ratings, t.scores
+        ({'a': 1508.0, 'b': 1492.0}, {'a': 1.0, 'b': 0.0})
+        """
+        change = self.k_factor * (landlord_won - self.expected_landlord_score(landlord, peasants))
+        self.ratings[landlord] += change
+        self.ratings[peasants] -= change
+        self.landlord_advantage += change / 2
+        self.games[landlord] += 1
+        self.games[peasants] += 1
+        self.scores[landlord] += landlord_won
+        self.scores[peasants] += not landlord_won
+
+    def play_pairing(self, landlord: str, peasants: str, games: int) -> int:
+        """
+        plays games between two candidates in lockstep and updates the ratings
+        :return: number of landlord wins
+        """
+        player_lists = [[Player() for _ in range(3)] for _ in range(games)]
+        for player_list in player_lists:
+            set_up_new_game(player_list, bidding=self.bidding,
+                            landlord_policy=self.candidates[landlord], peasants_policy=self.candidates[peasants])
+        wins = 0
+        for winner in play_games(player_lists, self.rule):
+            self.update_ratings(landlord, peasants, winner == LANDLORD)
+            wins += winner == LANDLORD
+        return wins
+
+    def half_width(self, name: str, round_num=1) -> float:
+        """
+        Hoeffding confidence half width of a candidate's mean score.
+        The bounds are checked after every round, so round r uses delta / (r * (r + 1)),
+        which sums to at most delta over all rounds
+        >>> t = Tournament({'a': None, 'b': None})
+        >>> t.games['a'] = 100
+        >>> round(t.half_width('a'), 4), round(t.half_width('a', round_num=5), 4)
+        (0.1593, 0.1973)
+        """
+        if not self.games[name]:
+            return 1.0
+        round_delta = self.delta / (round_num * (round_num + 1))
+        return sqrt(log(2 * len(self.candidates) / round_delta) / (2 * self.games[name]))
+
+    def mean_score(self, name: str) -> float:
+        return self.scores[name] / self.games[name] if self.games[name] else 0.5
+
+    def eliminate(self, round_num: int) -> list:
+        """
+        drops candidates whose upper bound is below the lower bound of the best candidate
+        :return: the dropped candidates
+        >>> t = Tournament({'a': None, 'b': None, 'c': None})
+        >>> t.games = {'a': 1000, 'b': 1000, 'c': 1000}
+        >>> t.scores = {'a': 700, 'b': 650, 'c': 300}
+        >>> t.eliminate(1), t.alive
+        (['c'], ['a', 'b'])
+        """
+        best_lower = max(self.mean_score(name) - self.half_width(name, round_num) for name in self.alive)
+        dropped = [name for name in self.alive
+                   if self.mean_score(name) + self.half_width(name, round_num) < best_lower]
+        for name in dropped:
+            self.alive.remove(name)
+            self.eliminated[name] = round_num
+        return dropped
+
+    def run(self, games_per_pairing=20, max_games=20000, print_details=False) -> list:
+        """
+        plays rounds of round robins among the alive candidates until one is left or the budget is used up
+        :param games_per_pairing: games per (landlord, peasants) pairing in each round
+        :param max_games: the total game budget
+        :param print_details: prints the standings after every round when true
+        :return: the standings, see standings()
+        """
+        played = 0
+        round_num = 0
+        while len(self.alive) > 1:
+            pairings = [(a, b) for a in self.alive for b in self.alive if a != b]
+            if played + len(pairings) * games_per_pairing > max_games:
+                break
+            round_num += 1
+            for landlord, peasants in pairings:
+                self.play_pairing(landlord, peasants, games_per_pairing)
+            played += len(pairings) * games_per_pairing
+            dropped = self.eliminate(round_num)
+            if print_details:
+                print(f'Round {round_num}: {played} games played, dropped {dropped}, alive {self.alive}')
+        return self.standings()
+
+    def standings(self) -> list:
+        """
+        :return: a list of dicts sorted by rating, one for each candidate
+        """
+        return sorted(({'name': name,
+                        'rating': round(self.ratings[name], 1),
+                        'games_played': self.games[name],
+                        'mean_score': self.mean_score(name),
+                        'eliminated_round': self.eliminated.get(name, '')} for name in self.candidates),
+                      key=lambda x: -x['rating'])
+
+
+def level_candidates(levels=range(10)) -> dict:
+    """
+    the original player levels as tournament candidates
+    >>> list(level_candidates(range(3)))
+    ['lv0', 'lv1', 'lv2']
+    """
+    return {f'lv{level}': quantile_policy(level) for level in levels}
+
+
+if __name__ == '__main__':
+    t0 = process_time()
+    rule_of_games = ORIGINAL_RULE
+    games_per_pairing = 20
+    game_budget = 20000
+    write_file = True
+
+    tournament = Tournament(level_candidates(), rule=rule_of_games)
+    results = tournament.run(games_per_pairing=games_per_pairing, max_games=game_budget, print_details=True)
+    for result in results:
+        print(result)
+
+    if write_file:
+        filename = "DouDiZhu_tournament_" + rules_int2str[rule_of_games] + ".csv"
+        with open(filename, "w", encoding="utf-8", newline='') as ddz_csv:
+            writer = csv.DictWriter(ddz_csv, fieldnames=results[0].keys())
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+
+    print('Total runtime:', process_time() - t0, 'seconds')